@@ -0,0 +1,96 @@
+import asyncio
+import collections
+import multiprocessing
+import queue
+import threading
+import time
+
+# One improved tour reported by a solver, route is a list of city indices without the start repeated
+Incumbent = collections.namedtuple("Incumbent", "route cost elapsed")
+
+# Tells a solver to stop, at the deadline (a time.time() value) or as soon as cancel() is called.
+# The flag lives in shared memory so the process pools of the parallel solvers see it too
+class CancelToken:
+    def __init__(self, time_limit=None, deadline=None):
+        if deadline is None and time_limit is not None:
+            deadline = time.time() + time_limit
+        self.deadline = deadline
+        self.flag = multiprocessing.RawValue("b", 0)
+
+    def cancel(self):
+        self.flag.value = 1
+
+    def cancelled(self):
+        return bool(self.flag.value) or (self.deadline is not None and time.time() >= self.deadline)
+
+    def remaining(self):
+        return float("inf") if self.deadline is None else max(0.0, self.deadline - time.time())
+
+# Function to check a token that may be None, for the solvers' loops
+def stopped(token):
+    return token is not None and token.cancelled()
+
+# Function to run a solver on a background thread. It is called with token= and report= on top
+# of args and kwargs, and every report(route, cost) it makes lands in the returned queue as an
+# Incumbent, followed by ("done", result) or ("error", exception) when it returns
+def start(solver, args, kwargs, token):
+    found = queue.Queue()
+    begin_time = time.time()
+
+    def report(route, cost):
+        found.put(Incumbent(list(route), cost, time.time() - begin_time))
+
+    def run():
+        try:
+            found.put(("done", solver(*args, token=token, report=report, **kwargs)))
+        except BaseException as error:
+            found.put(("error", error))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, found
+
+# Generator giving every improved tour a solver finds as an Incumbent, as soon as it is found.
+# Any of simulated_annealing, batched_annealing, hill_climbing, lin_kernighan, solve_tsp_branch_bound
+# and brute_force can be run. The solver stops after budget seconds, when token is cancelled, or when the
+# caller stops iterating (closing the generator cancels the token), the last Incumbent is the best tour
+def incumbents(solver, *args, budget=None, token=None, **kwargs):
+    token = token or CancelToken(budget)
+    thread, found = start(solver, args, kwargs, token)
+    try:
+        while True:
+            item = found.get()
+            if isinstance(item, Incumbent):
+                yield item
+            elif item[0] == "error":
+                raise item[1]
+            else:
+                return
+    finally:
+        token.cancel()
+        thread.join()
+
+# Function to run a solver within a time budget and get the best tour it found, None if it found nothing
+def best_incumbent(solver, *args, budget=None, token=None, **kwargs):
+    best = None
+    for best in incumbents(solver, *args, budget=budget, token=token, **kwargs):
+        pass
+    return best
+
+# Same as incumbents but as an async generator, waiting for the solver does not block the event loop
+async def stream(solver, *args, budget=None, token=None, **kwargs):
+    loop = asyncio.get_running_loop()
+    token = token or CancelToken(budget)
+    thread, found = start(solver, args, kwargs, token)
+    try:
+        while True:
+            item = await loop.run_in_executor(None, found.get)
+            if isinstance(item, Incumbent):
+                yield item
+            elif item[0] == "error":
+                raise item[1]
+            else:
+                return
+    finally:
+        token.cancel()
+        await loop.run_in_executor(None, thread.join)
@@ -0,0 +1,103 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import time
+import Benchmark
+import SolutionCache
+
+OUTPUT_DIR = "results"
+RESULTS_LOG = "results.jsonl" # one record per line, appended as each job finishes
+
+# Function to turn instance arguments into (name, path, size) tuples. Each argument is a glob
+# ("tsplib-master/pr*.tsp") or a bare instance name looked up in tsp_dir
+def expand_instances(patterns, tsp_dir=Benchmark.TSP_DIR):
+    paths = set()
+    for pattern in patterns:
+        if not glob.has_magic(pattern) and not os.path.exists(pattern):
+            pattern = os.path.join(tsp_dir, pattern if pattern.endswith(".tsp") else pattern + ".tsp")
+        paths.update(path for path in glob.glob(pattern) if path.endswith(".tsp"))
+    instances = []
+    for path in sorted(paths):
+        size = Benchmark.instance_size(path)
+        if size is not None:
+            instances.append((os.path.splitext(os.path.basename(path))[0], path, size))
+    return instances
+
+# Function to make the job list: every solver on every instance it runs on (Benchmark.runs_on),
+# once per parameter set. params maps a solver to a dict of keyword arguments or a
+# list of them, a list gives one job per dict. Jobs are (name, path, size, solver, params, tag),
+# tag names the job's output files
+def make_jobs(instances, solvers, params=None, ignore_caps=False):
+    jobs = []
+    for name, path, size in instances:
+        for solver in solvers:
+            if not Benchmark.runs_on(solver, path, size, ignore_caps):
+                continue
+            settings = (params or {}).get(solver, {})
+            variants = settings if isinstance(settings, list) else [settings]
+            for k, variant in enumerate(variants):
+                tag = f"{name}.{solver}" if len(variants) == 1 else f"{name}.{solver}.{k}"
+                jobs.append((name, path, size, solver, variant, tag))
+    return jobs
+
+# Function to order the jobs largest instance first. Handing the longest jobs out first
+# (longest processing time first) stops one big instance starting last and holding up the batch
+def schedule(jobs):
+    return sorted(jobs, key=lambda job: (-job[2], job[0], job[3]))
+
+# Function to run the jobs on up to workers at a time, each in its own process under the time
+# and memory limits. Every finished job is printed, appended to output_dir/results.jsonl and
+# has its tour written to output_dir/tours/TAG.tour straight away, so a batch that is stopped
+# part way keeps everything finished so far. With a cache_dir, runs already in that SolutionCache
+# are read back instead of solved, and warm_start seeds the solvers with cached tours.
+# Returns the records in job order
+def run_batch(jobs, output_dir=OUTPUT_DIR, workers=None, time_limit=Benchmark.JOB_TIME_LIMIT, memory_limit=None,
+              cache_dir=None, warm_start=False):
+    tour_dir = os.path.join(output_dir, "tours")
+    os.makedirs(tour_dir, exist_ok=True)
+    solutions = Benchmark.load_solutions()
+    records = [None] * len(jobs)
+    # the threads only start the job processes and wait on them, the solving happens in the processes
+    with open(os.path.join(output_dir, RESULTS_LOG), "a") as log, \
+            concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+        futures = {}
+        for k, (name, path, size, solver, params, tag) in enumerate(jobs):
+            tour_file = os.path.join(tour_dir, tag + ".tour")
+            future = pool.submit(Benchmark.run_job, name, path, size, solver, params, time_limit, solutions,
+                                 memory_limit=memory_limit, tour_file=tour_file, cache_dir=cache_dir, warm_start=warm_start)
+            futures[future] = k, tag
+        for future in concurrent.futures.as_completed(futures):
+            k, tag = futures[future]
+            record = future.result()
+            record["tag"] = tag
+            records[k] = record
+            log.write(json.dumps(record) + "\n")
+            log.flush()
+            print(Benchmark.format_record(record), flush=True)
+    return records
+
+# Main Code
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run solvers over many instances at once, results and tours go to an output folder")
+    parser.add_argument("instances", nargs="+", help="instance files, globs or names, e.g. 'tsplib-master/pr*.tsp' berlin52")
+    parser.add_argument("--solvers", nargs="+", default=["lin_kernighan"], choices=list(Benchmark.SOLVERS))
+    parser.add_argument("--params", type=json.loads, default={},
+                        help='per solver keyword arguments as JSON, a list runs one job per entry, e.g. {"lin_kernighan": [{"time_limit": 5}, {"time_limit": 30}]}')
+    parser.add_argument("--workers", type=int, help="jobs run at the same time, defaults to the number of CPUs")
+    parser.add_argument("--time-limit", type=float, default=Benchmark.JOB_TIME_LIMIT, help="seconds per job")
+    parser.add_argument("--memory-limit", type=float, help="MB per job, a job going over is stopped")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="folder for results.jsonl, results.json/csv and tours/")
+    parser.add_argument("--tsp-dir", default=Benchmark.TSP_DIR, help="where bare instance names are looked up")
+    parser.add_argument("--cache", nargs="?", const=SolutionCache.CACHE_DIR, help="reuse tours from this solution cache folder (default folder if no value)")
+    parser.add_argument("--warm-start", action="store_true", help="start solvers that can from the best cached tour, needs --cache")
+    parser.add_argument("--ignore-caps", action="store_true", help="also run solvers on instances above their size cap")
+    args = parser.parse_args()
+
+    jobs = schedule(make_jobs(expand_instances(args.instances, args.tsp_dir), args.solvers, args.params, args.ignore_caps))
+    print("Running", len(jobs), "jobs")
+    begin_time = time.time()
+    records = run_batch(jobs, args.output, args.workers, args.time_limit, args.memory_limit, args.cache, args.warm_start)
+    Benchmark.save_results(records, os.path.join(args.output, "results"))
+    print("Finished", sum(record["status"] == "ok" for record in records), "of", len(records), "jobs in", round(time.time() - begin_time, 1), "s")
@@ -0,0 +1,377 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import DistanceMatrix
+import TSPParser
+import SpatialIndex
+import HeldKarp
+import BruteForce
+import BranchAndBound2
+import NearestNeighbour
+import Christofides
+import hillclimbing
+import SimulatedAnnealing
+import LinKernighan
+import SpatialDecomposition
+import SolutionCache
+
+TSP_DIR = "./tsplib-master"
+SOLUTIONS_FILE = os.path.join(TSP_DIR, "solutions")
+JOB_TIME_LIMIT = 600 # seconds before a run is stopped and recorded as a timeout
+TIME_TOLERANCE = 0.25 # solve times within this fraction of the baseline are noise
+MIN_SECONDS = 0.1 # and so are differences smaller than this
+POLL_SECONDS = 0.2 # how often a running job's memory is checked when it has a memory limit
+
+# Instance tiers by number of cities, (smallest, largest) inclusive
+TIERS = {
+    "tiny": (0, 16),
+    "small": (17, 200),
+    "medium": (201, 2000),
+    "large": (2001, 20000),
+    "huge": (20001, float("inf")),
+}
+DEFAULT_TIERS = ("tiny", "small", "medium")
+
+# Keyword arguments each solver is run with unless the caller overrides them
+DEFAULT_PARAMS = {
+    "simulated_annealing": {"initial_temp": 500, "cooling_rate": 0.999995, "max_iterations": 2000000},
+    "batched_annealing": {"chains": 64, "steps": 100000},
+    "lin_kernighan": {"time_limit": 60, "max_kicks": 1000}, # a kick budget keeps the solve times comparable
+    "spatial_decomposition": {},
+}
+
+# Function to run a solver adapter, every adapter takes (problem, cities, graph, params)
+# and returns (route of city indices without the start repeated, cost).
+# The adapters in WARM_STARTS also take an initial_route in params
+def run_held_karp(problem, cities, graph, params):
+    cost, tour = HeldKarp.held_karp(graph)
+    return tour[:-1], cost
+
+def run_brute_force(problem, cities, graph, params):
+    route, cost = BruteForce.brute_force(cities, graph, **params)[:2]
+    return route, cost
+
+def run_branch_bound(problem, cities, graph, params):
+    cost, path = BranchAndBound2.solve_tsp_branch_bound(graph, **params)[:2]
+    return path[:-1], cost
+
+def run_nearest_neighbour(problem, cities, graph, params):
+    path, cost = NearestNeighbour.tsp_nearest_neighbour(graph, cities, problem)[:2]
+    return path[:-1], cost
+
+def run_greedy_edge(problem, cities, graph, params):
+    path, cost = NearestNeighbour.greedy_edge(graph, cities, problem, **params)[:2]
+    return path[:-1], cost
+
+def run_space_filling_curve(problem, cities, graph, params):
+    path, cost = NearestNeighbour.space_filling_curve(graph, cities, problem)[:2]
+    return path[:-1], cost
+
+def run_christofides(problem, cities, graph, params):
+    tour = Christofides.christofides_tsp(graph, problem, cities, **params)[0]
+    return tour[:-1], DistanceMatrix.route_cost(tour[:-1], graph)
+
+# Function to get the tour a local search starts from, the initial_route in params if there is one
+def start_route(problem, cities, graph, params):
+    params = dict(params)
+    start = params.pop("initial_route", None)
+    if start is None:
+        start = NearestNeighbour.tsp_nearest_neighbour(graph, cities, problem)[0]
+    return start, params
+
+def run_hill_climbing(problem, cities, graph, params):
+    start, params = start_route(problem, cities, graph, params)
+    candidates = SpatialIndex.candidate_lists(problem, cities, graph, hillclimbing.CANDIDATES)
+    route, cost = hillclimbing.hill_climbing(cities, graph, start, candidates, **params)[:2]
+    return route, cost
+
+def run_simulated_annealing(problem, cities, graph, params):
+    route, cost = SimulatedAnnealing.simulated_annealing(cities, graph, **params)[:2]
+    return route, cost
+
+def run_batched_annealing(problem, cities, graph, params):
+    route, cost = SimulatedAnnealing.batched_annealing(cities, graph, **params)[:2]
+    return route, cost
+
+def run_lin_kernighan(problem, cities, graph, params):
+    start, params = start_route(problem, cities, graph, params)
+    candidates = SpatialIndex.candidate_lists(problem, cities, graph, LinKernighan.CANDIDATES)
+    route, cost = LinKernighan.lin_kernighan(cities, graph, start, candidates, **params)[:2]
+    return route, cost
+
+def run_spatial_decomposition(problem, cities, graph, params):
+    route, cost = SpatialDecomposition.spatial_decomposition(problem, cities, graph, **params)[:2]
+    return route, cost
+
+# Solver name -> (adapter, largest instance it is run on, None for no cap)
+SOLVERS = {
+    "held_karp": (run_held_karp, 16),
+    "brute_force": (run_brute_force, 14),
+    "branch_bound": (run_branch_bound, 60),
+    "nearest_neighbour": (run_nearest_neighbour, None),
+    "greedy_edge": (run_greedy_edge, None),
+    "space_filling_curve": (run_space_filling_curve, None),
+    "christofides": (run_christofides, None),
+    "hill_climbing": (run_hill_climbing, 20000),
+    "simulated_annealing": (run_simulated_annealing, 2000),
+    "batched_annealing": (run_batched_annealing, 2000),
+    "lin_kernighan": (run_lin_kernighan, 20000),
+    "spatial_decomposition": (run_spatial_decomposition, None),
+}
+
+# Solvers that need city coordinates, they are not run on EXPLICIT instances
+COORDINATE_SOLVERS = ("space_filling_curve", "spatial_decomposition")
+
+# Solvers that can start from (or be bounded by) a known tour, see SolutionCache
+WARM_STARTS = ("brute_force", "branch_bound", "hill_climbing", "simulated_annealing", "lin_kernighan")
+
+# Function to read the optimal tour lengths, lines look like "berlin52 : 7542"
+def load_solutions(path=SOLUTIONS_FILE):
+    solutions = {}
+    if not os.path.exists(path):
+        return solutions
+    with open(path) as file:
+        for line in file:
+            name, _, value = line.partition(":")
+            if value.strip():
+                solutions[name.strip()] = float(value.split()[0])
+    return solutions
+
+# Function to read one field of a TSPLIB header without parsing the whole file, None if it is missing
+def header_value(filename, field):
+    with open(filename) as file:
+        for line in file:
+            key, _, value = line.partition(":")
+            if key.strip() == field:
+                return value.strip()
+            if key.strip().endswith("SECTION"):
+                break
+    return None
+
+# Function to get the number of cities from a TSPLIB header
+def instance_size(filename):
+    size = header_value(filename, "DIMENSION")
+    return None if size is None else int(size)
+
+# Function to check whether a solver is run on an instance: the instance is within the solver's
+# size cap (unless ignore_caps) and has coordinates if the solver needs them
+def runs_on(solver, path, size, ignore_caps=False):
+    cap = SOLVERS[solver][1]
+    if cap is not None and size > cap and not ignore_caps:
+        return False
+    return solver not in COORDINATE_SOLVERS or header_value(path, "EDGE_WEIGHT_TYPE") != "EXPLICIT"
+
+# Function to list the instances in the given tiers as (name, path, size), smallest first
+def select_instances(tiers=DEFAULT_TIERS, tsp_dir=TSP_DIR, names=None):
+    instances = []
+    for path in glob.glob(os.path.join(tsp_dir, "*.tsp")):
+        name = os.path.splitext(os.path.basename(path))[0]
+        size = instance_size(path)
+        if size is None or (names and name not in names):
+            continue
+        if any(TIERS[tier][0] <= size <= TIERS[tier][1] for tier in tiers):
+            instances.append((name, path, size))
+    return sorted(instances, key=lambda instance: (instance[2], instance[0]))
+
+# Function to load an instance for the solvers. Above DistanceMatrix.DENSE_LIMIT cities coordinate
+# problems get distances computed on demand, so no run pays for building the memory-mapped store
+def load_instance(filename):
+    problem = TSPParser.parse_tsp_file(filename)
+    cities = list(problem.get_nodes())
+    if len(cities) > DistanceMatrix.DENSE_LIMIT and problem.edge_weight_type in DistanceMatrix.DISTANCE_FUNCTIONS:
+        return problem, cities, DistanceMatrix.CoordinateDistances(problem, cities)
+    return DistanceMatrix.load_tsp_file(filename)
+
+# Function to get the peak resident memory of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+# Function to get the anonymous (heap, not file-backed) resident memory of a process in MB,
+# None where /proc is not available
+def process_memory_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+# Function run in a fresh process for each job, so the peak memory belongs to that job alone.
+# Sends back a dict with the timings, the tour's cost and the route, and writes the tour to
+# tour_file as a TSPLIB .tour file when one is given. With a cache_dir a run already in the
+# SolutionCache is not solved again, and with warm_start the solvers in WARM_STARTS start
+# from the best cached tour of the instance. Warm-started runs are cached apart from cold ones
+def measure(filename, solver, params, connection, tour_file=None, cache_dir=None, warm_start=False):
+    result = {"status": "ok"}
+    try:
+        begin_time = time.time()
+        problem, cities, graph = load_instance(filename)
+        load_end = time.time()
+        cache = SolutionCache.SolutionCache(cache_dir) if cache_dir else None
+        digest = SolutionCache.instance_digest(problem) if cache else None
+        best = cache.best(digest) if cache and warm_start and solver in WARM_STARTS else None
+        # a warm-started run depends on its seed, so it gets its own key
+        cache_params = params if best is None else dict(params, warm_start=SolutionCache.route_digest(best[0]))
+        found = cache.get(digest, solver, cache_params) if cache else None
+        if found is not None:
+            route, cost = found
+            result["cached"] = True
+        else:
+            run_params = params if best is None else dict(params, initial_route=best[0])
+            route, cost = SOLVERS[solver][0](problem, cities, graph, run_params)
+            if cache:
+                cache.put(digest, solver, cache_params, route, cost)
+        solve_end = time.time()
+        if sorted(int(city) for city in route) != list(range(len(cities))):
+            raise ValueError("the solver did not return a tour of every city")
+        result.update(cost=float(cost), route=[int(city) for city in route], load_time=load_end - begin_time,
+                      solve_time=solve_end - load_end, parse_time=problem.parse_time)
+        if tour_file is not None:
+            TSPParser.write_tour_file(tour_file, os.path.basename(tour_file), route, cities, f"{solver}, cost {cost}")
+    except Exception as error:
+        result.update(status="error", error=f"{type(error).__name__}: {error}")
+    result["peak_rss_mb"] = peak_rss_mb()
+    connection.send(result)
+    connection.close()
+
+# Function to wait for a job's result. The job is given up on once it runs past time_limit seconds
+# or, with a memory_limit in MB, once its memory goes over it (checked every POLL_SECONDS)
+def wait_for_result(process, receiver, time_limit, memory_limit=None):
+    deadline = time.time() + time_limit
+    while True:
+        wait = max(0.0, deadline - time.time())
+        try:
+            if receiver.poll(min(wait, POLL_SECONDS) if memory_limit is not None else wait):
+                return receiver.recv()
+        except EOFError:
+            return {"status": "crashed", "error": f"exit code {process.exitcode}"} # died without sending, e.g. killed by the OOM killer
+        if time.time() >= deadline:
+            return {"status": "timeout"}
+        if memory_limit is not None:
+            memory = process_memory_mb(process.pid)
+            if memory is not None and memory > memory_limit:
+                return {"status": "memory", "peak_rss_mb": memory, "error": f"{memory:.0f} MB is over the {memory_limit:g} MB limit"}
+
+# Function to run one solver on one instance in a child process, with a time limit and optionally
+# a memory limit in MB. The tour is only kept in the record when keep_route is set, and is
+# written to tour_file when one is given. cache_dir and warm_start are passed on to measure
+def run_job(name, path, size, solver, params=None, time_limit=JOB_TIME_LIMIT, solutions=None, keep_route=False,
+            memory_limit=None, tour_file=None, cache_dir=None, warm_start=False):
+    params = dict(DEFAULT_PARAMS.get(solver, {}), **(params or {}))
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=measure, args=(path, solver, params, sender, tour_file, cache_dir, warm_start))
+    begin_time = time.time()
+    process.start()
+    sender.close()
+    result = wait_for_result(process, receiver, time_limit, memory_limit)
+    process.join(1)
+    if process.is_alive():
+        process.kill()
+        process.join()
+    if not keep_route:
+        result.pop("route", None)
+    record = {"instance": name, "n": size, "solver": solver, "params": params, "wall_time": time.time() - begin_time}
+    record.update(result)
+    optimum = (solutions or {}).get(name)
+    if optimum and record.get("cost") is not None:
+        record["optimum"] = optimum
+        record["gap"] = 100 * (record["cost"] - optimum) / optimum
+    return record
+
+# Function to run every solver over every instance it is allowed on, printing each result as it comes in
+def run_benchmark(instances, solvers, params=None, time_limit=JOB_TIME_LIMIT):
+    solutions = load_solutions()
+    results = []
+    for name, path, size in instances:
+        for solver in solvers:
+            if not runs_on(solver, path, size):
+                continue
+            record = run_job(name, path, size, solver, (params or {}).get(solver), time_limit, solutions)
+            results.append(record)
+            print(format_record(record), flush=True)
+    return results
+
+def format_record(record):
+    if record["status"] != "ok":
+        return f"{record['instance']:>12} {record['solver']:<22} {record['status']} {record.get('error', '')}"
+    gap = f"{record['gap']:7.2f}%" if "gap" in record else "       -"
+    return (f"{record['instance']:>12} {record['solver']:<22} cost {record['cost']:>12.0f} gap {gap} "
+            f"load {record['load_time']:7.2f}s solve {record['solve_time']:8.2f}s rss {record['peak_rss_mb']:7.1f}MB"
+            + (" (cached)" if record.get("cached") else ""))
+
+CSV_FIELDS = ["instance", "n", "solver", "status", "cost", "optimum", "gap", "load_time", "parse_time",
+              "solve_time", "wall_time", "peak_rss_mb", "error"]
+
+# Function to write the results as JSON and CSV next to each other, output is the path without extension
+def save_results(results, output):
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output + ".json", "w") as file:
+        json.dump(results, file, indent=1)
+    with open(output + ".csv", "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+# Function to compare results with a stored baseline run. Returns (kind, instance, solver, old, new)
+# tuples, kind is slower/faster for solve time, worse/better for cost and failed when a run that
+# used to work does not any more
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, min_seconds=MIN_SECONDS):
+    before = {(record["instance"], record["solver"]): record for record in baseline}
+    changes = []
+    for record in results:
+        old = before.get((record["instance"], record["solver"]))
+        if old is None or old["status"] != "ok":
+            continue
+        key = (record["instance"], record["solver"])
+        if record["status"] != "ok":
+            changes.append(("failed", *key, old["status"], record["status"]))
+            continue
+        if record["cost"] > old["cost"]:
+            changes.append(("worse", *key, old["cost"], record["cost"]))
+        elif record["cost"] < old["cost"]:
+            changes.append(("better", *key, old["cost"], record["cost"]))
+        difference = record["solve_time"] - old["solve_time"]
+        if abs(difference) > max(min_seconds, time_tolerance * old["solve_time"]):
+            changes.append(("slower" if difference > 0 else "faster", *key, old["solve_time"], record["solve_time"]))
+    return changes
+
+REGRESSIONS = ("slower", "worse", "failed")
+
+# Main Code
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the solvers over tsplib-master and record cost, gap, time and memory")
+    parser.add_argument("--tiers", nargs="+", default=list(DEFAULT_TIERS), choices=list(TIERS))
+    parser.add_argument("--solvers", nargs="+", default=list(SOLVERS), choices=list(SOLVERS))
+    parser.add_argument("--instances", nargs="+", help="only these instance names")
+    parser.add_argument("--params", type=json.loads, default={}, help='per solver keyword arguments as JSON, e.g. {"lin_kernighan": {"time_limit": 5}}')
+    parser.add_argument("--time-limit", type=float, default=JOB_TIME_LIMIT, help="seconds per run")
+    parser.add_argument("--output", default="benchmark", help="results go to OUTPUT.json and OUTPUT.csv")
+    parser.add_argument("--baseline", help="baseline JSON to check the results against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    instances = select_instances(args.tiers, names=args.instances)
+    results = run_benchmark(instances, args.solvers, args.params, args.time_limit)
+    save_results(results, args.output)
+
+    failed = False
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            changes = compare(results, json.load(file))
+        for kind, instance, solver, old, new in changes:
+            print(f"{kind:>7} {instance} {solver}: {old} -> {new}")
+        failed = any(change[0] in REGRESSIONS for change in changes)
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=1)
+    sys.exit(1 if failed else 0)
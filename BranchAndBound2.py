@@ -1,94 +1,437 @@
 import numpy as np
-import tsplib95
 import matplotlib.pyplot as plt
+import os
 import time
+import multiprocessing
+import DistanceMatrix
+import NearestNeighbour
+import hillclimbing
+import Anytime
+import Instrument
 
+ROOT_ITERATIONS = 1000 # subgradient steps for the root bound
+NODE_ITERATIONS = 50 # subgradient steps at every other node, starting from the parent's penalties
+ROOT_STEP = 2.0 # starting step size, as a fraction of the gap to the incumbent
+NODE_STEP = 0.5
+STALL_STEPS = 20 # the step is halved after this many steps without a better bound
+MIN_STEP = 1e-3
+REQUIRED_COST = 1e9 # taken off required edges so every spanning tree picks them
+BOUND_TOLERANCE = 1e-6 # the penalties are floats, so bounds carry rounding noise
+TASKS_PER_WORKER = 8 # subtrees handed out per worker, so a worker with easy subtrees takes more of them
+SAMPLE_NODES = 100 # search nodes between samples when instrumentation is on
 
-# Load TSPLIB file using tsplib95
+# Load TSPLIB file using the shared distance matrix loader
 def load_tsp_file(filename):
-    problem = tsplib95.load(filename)
-    cities = list(problem.get_nodes())
-    adj_matrix = np.array([[problem.get_weight(i, j) for j in cities] for i in cities]) # an adjacency matrix is a dis
+    problem, cities, adj_matrix = DistanceMatrix.load_tsp_file(filename) # an adjacency matrix is a dis
     return adj_matrix, cities, problem
 
 # Branch and Bound Functions
-def first_min(adj, i): #finds the first minimum edge distance from i to any other node
-    min_val = np.inf
-    for k in range(len(adj)):
-        if adj[i][k] < min_val and i != k:
-            min_val = adj[i][k]
-    return min_val
-
-def second_min(adj, i): #finds the second minimum edge distance from i to any other node
-    first, second = np.inf, np.inf
-    for j in range(len(adj)):
-        if i == j:
+# The lower bound is the Held-Karp 1-tree bound: a spanning tree on cities 1..n-1 plus the two
+# cheapest edges at city 0, with a penalty pi[i] added to every edge at city i. Every tour is a
+# 1-tree, so the cheapest 1-tree minus twice the penalties never exceeds the best tour, and
+# subgradient steps on pi push the 1-tree towards degree 2 everywhere to tighten the bound.
+# A search node is a set of forbidden and required edges, branched on at a city of degree > 2.
+
+# Function to get a starting incumbent from nearest neighbour plus 2-opt, as a path starting and ending at 0.
+# A known tour (initial_route, e.g. from SolutionCache) is used instead when it is cheaper
+def initial_incumbent(adj, initial_route=None):
+    N = len(adj)
+    route = NearestNeighbour.tsp_nearest_neighbour(adj, range(N))[0][:N]
+    route, cost = hillclimbing.local_search(route, adj)
+    if initial_route is not None and DistanceMatrix.route_cost(list(initial_route), adj) < cost:
+        route = [int(city) for city in initial_route]
+        cost = DistanceMatrix.route_cost(route, adj)
+    start = route.index(0)
+    route = route[start:] + route[:start]
+    return cost, route + [0]
+
+# Function to find a minimum spanning tree with Prim's algorithm on a dense weight matrix.
+# Returns the parent of every node (-1 for node 0) and the order nodes joined in, None if disconnected
+def spanning_tree(w):
+    m = len(w)
+    parent = np.full(m, -1)
+    order = np.zeros(m, dtype=np.int64)
+    in_tree = np.zeros(m, dtype=bool)
+    in_tree[0] = True
+    best = w[0].copy()
+    best[0] = np.inf
+    link = np.zeros(m, dtype=np.int64)
+    for k in range(1, m):
+        v = int(np.argmin(best))
+        if in_tree[v] or best[v] == np.inf:
+            return None
+        parent[v] = link[v]
+        order[k] = v
+        in_tree[v] = True
+        best[v] = np.inf
+        closer = ~in_tree & (w[v] < best)
+        best[closer] = w[v][closer]
+        link[closer] = v
+    return parent, order
+
+# Function to build the cheapest 1-tree under the penalties pi. Forbidden edges cost infinity and
+# required edges are made so cheap they are always taken. Returns (bound, degree, edges, parent,
+# order, ends, w, reduced), where parent/order are over cities 1..n-1 (index 0 is city 1) and ends
+# are the two cities joined to city 0, or None when the constraints leave no 1-tree
+def one_tree(costs, pi, forbidden, required):
+    reduced = costs + pi[:, None] + pi[None, :]
+    w = np.where(forbidden, np.inf, np.where(required, reduced - REQUIRED_COST, reduced))
+    tree = spanning_tree(w[1:, 1:])
+    if tree is None:
+        return None
+    parent, order = tree
+    ends = np.argsort(w[0, 1:], kind="stable")[:2] + 1
+    if w[0, ends[1]] == np.inf:
+        return None
+
+    child = np.flatnonzero(parent >= 0)
+    edges = np.concatenate([np.column_stack([child + 1, parent[child] + 1]), [[0, ends[0]], [0, ends[1]]]])
+    degree = np.bincount(edges.ravel(), minlength=len(costs))
+    bound = float(reduced[edges[:, 0], edges[:, 1]].sum() - 2 * pi.sum()) # true costs, not the required edge discount
+    return bound, degree, edges, parent, order, ends, w, reduced
+
+# Function to run subgradient steps on the penalties, pi[i] moves by the step times (degree - 2).
+# Stops early once the bound passes limit (the node can be pruned) or the 1-tree is a tour.
+# Returns the best (bound, pi, tree), or None if the node has no 1-tree at all
+def subgradient(costs, pi, forbidden, required, upper, limit, iterations, step):
+    pi = pi.copy()
+    best = None
+    stall = 0
+    for _ in range(iterations):
+        tree = one_tree(costs, pi, forbidden, required)
+        if tree is None:
+            return None
+        bound, degree = tree[0], tree[1]
+        g = degree - 2
+        norm = int((g * g).sum())
+        if best is None or bound > best[0] or norm == 0:
+            best = (bound, pi.copy(), tree)
+            stall = 0
+        else:
+            stall += 1
+            if stall >= STALL_STEPS:
+                step /= 2
+                stall = 0
+        if norm == 0 or bound > limit or step < MIN_STEP:
+            break
+        pi += step * (upper - bound) / norm * g
+    return best
+
+# Function to walk the 1-tree when every city has degree 2, giving the tour from city 0 back to city 0
+def tree_tour(edges, n):
+    neighbours = [[] for _ in range(n)]
+    for i, j in edges.tolist():
+        neighbours[i].append(j)
+        neighbours[j].append(i)
+    path = [0, neighbours[0][0]]
+    while len(path) <= n:
+        a, b = neighbours[path[-1]]
+        path.append(a if a != path[-2] else b)
+    return path
+
+# Function to forbid the edge (i, j), False if it is already required
+def forbid_edge(forbidden, required, i, j):
+    if required[i, j]:
+        return False
+    forbidden[i, j] = forbidden[j, i] = True
+    return True
+
+# Function to require the edge (i, j), False if that makes a tour impossible. A city with two
+# required edges loses all its others, and the edge that would close the path of required edges
+# through (i, j) into a short cycle is forbidden
+def require_edge(forbidden, required, i, j):
+    if required[i, j]:
+        return True
+    if forbidden[i, j] or required[i].sum() == 2 or required[j].sum() == 2:
+        return False
+    n = len(required)
+    required[i, j] = required[j, i] = True
+    for city in (i, j):
+        if required[city].sum() == 2:
+            others = ~required[city]
+            forbidden[city, others] = True
+            forbidden[others, city] = True
+
+    # follow the required path out from (i, j) in both directions
+    ends = []
+    length = 1
+    for start, previous in ((i, j), (j, i)):
+        while True:
+            following = [c for c in np.flatnonzero(required[start]) if c != previous]
+            if not following:
+                break
+            previous, start = start, int(following[0])
+            length += 1
+            if start in (i, j):
+                return length == n # the required edges closed a cycle, only fine if it is the whole tour
+        ends.append(start)
+    if length < n - 1:
+        forbid_edge(forbidden, required, ends[0], ends[1])
+    return True
+
+# Function to get the most expensive edge on the tree path between every pair of tree nodes
+def path_maximum(w, parent, order):
+    m = len(w)
+    most = np.full((m, m), -np.inf)
+    for k in range(1, m):
+        v = order[k]
+        done = order[:k]
+        most[v, done] = np.maximum(most[parent[v], done], w[v, parent[v]])
+        most[done, v] = most[v, done]
+    return most
+
+# Function to fix and forbid edges by reduced cost. Swapping a non-tree edge into the 1-tree
+# costs its reduced cost minus the dearest edge it pushes out, and dropping a tree edge costs the
+# cheapest edge that reconnects the tree. Any edge whose swap lifts the bound past limit is
+# forbidden (or required). Returns the number of edges changed, or -1 if the node became infeasible
+def reduced_cost_fixing(tree, limit, forbidden, required):
+    bound, degree, edges, parent, order, ends, w, reduced = tree
+    n = len(w)
+    changes = []
+
+    # forbid edges between cities 1..n-1 that cannot beat the incumbent
+    sub = w[1:, 1:]
+    most = path_maximum(sub, parent, order)
+    in_tree = np.zeros((n, n), dtype=bool)
+    in_tree[edges[:, 0], edges[:, 1]] = in_tree[edges[:, 1], edges[:, 0]] = True
+    out = np.triu(bound + reduced[1:, 1:] - most > limit, 1) & ~forbidden[1:, 1:] & ~in_tree[1:, 1:]
+    changes += [(False, int(i) + 1, int(j) + 1) for i, j in zip(*np.nonzero(out))]
+    # city 0 edges push out the dearer of its two tree edges
+    out = bound + reduced[0, 1:] - w[0, ends[1]] > limit
+    changes += [(False, 0, int(j) + 1) for j in np.flatnonzero(out) if not forbidden[0, j + 1] and not in_tree[0, j + 1]]
+
+    # require tree edges between cities 1..n-1 that every cheaper 1-tree uses
+    below = np.eye(n - 1, dtype=bool)
+    for v in order[:0:-1]:
+        below[parent[v]] |= below[v]
+    for v in order[1:]:
+        p = parent[v]
+        if required[v + 1, p + 1]:
             continue
-        if adj[i][j] <= first:
-            second = first
-            first = adj[i][j]
-        elif adj[i][j] <= second:
-            second = adj[i][j]
-    return second
-
-def tsp_rec(adj, current_bound, current_weight, level, current_path, visited, final_res, final_path): #recursive function to solve by pruning branches
-    N = len(adj) 
-
-    if level == N:
-        if adj[current_path[level - 1]][current_path[0]] != 0:
-            current_res = current_weight + adj[current_path[level - 1]][current_path[0]]
-            if current_res < final_res[0]:
-                final_path[:N + 1] = current_path[:]
-                final_path[N] = current_path[0]
-                final_res[0] = current_res
-        return
+        side = below[v]
+        crossing = sub[np.ix_(side, ~side)].copy()
+        crossing[side[:v].sum(), (~side)[:p].sum()] = np.inf # the tree edge itself
+        if bound - reduced[v + 1, p + 1] + crossing.min() > limit:
+            changes.append((True, v + 1, p + 1))
+    # city 0 edges against the third cheapest edge at city 0
+    third = np.partition(w[0, 1:], 2)[2] if n > 3 else np.inf
+    for end in ends:
+        if not required[0, end] and bound - reduced[0, end] + third > limit:
+            changes.append((True, 0, int(end)))
 
-    for i in range(N):
-        if adj[current_path[level-1]][i] != 0 and not visited[i]:
-            temp = current_bound
-            current_weight += adj[current_path[level - 1]][i]
+    for need, i, j in changes:
+        feasible = require_edge(forbidden, required, i, j) if need else forbid_edge(forbidden, required, i, j)
+        if not feasible:
+            return -1
+    return len(changes)
 
-            if level == 1:
-                current_bound -= (first_min(adj, current_path[level - 1]) + first_min(adj, i)) / 2
-            else:
-                current_bound -= (second_min(adj, current_path[level - 1]) + first_min(adj, i)) / 2
+# Function to bound a search node, repeating while reduced cost fixing keeps changing edges.
+# costs is the float copy of adj the 1-trees are built on, tour costs come from adj itself.
+# Returns (bound, pi, tree), with tree None for pruned or infeasible nodes. report(route, cost) is
+# called whenever the 1-tree is a better tour than the incumbent
+def evaluate(adj, costs, pi, forbidden, required, final_res, final_path, gap, iterations, step, stats, report=None):
+    stats["nodes"] += 1
+    while True:
+        limit = final_res[0] - gap + BOUND_TOLERANCE
+        result = subgradient(costs, pi, forbidden, required, final_res[0], limit, iterations, step)
+        if result is None:
+            return -np.inf, pi, None
+        bound, pi, tree = result
+        if (tree[1] == 2).all():
+            path = tree_tour(tree[2], len(costs))
+            cost = DistanceMatrix.route_cost(path[:-1], adj)
+            if cost < final_res[0]:
+                final_res[0] = cost
+                final_path[:] = path
+                if report is not None:
+                    report(path[:-1], cost)
+            return bound, pi, None
+        if bound > limit:
+            return bound, pi, None
+        changed = reduced_cost_fixing(tree, limit, forbidden, required)
+        if changed < 0:
+            return bound, pi, None
+        stats["fixed"] += changed
+        if changed == 0:
+            return bound, pi, tree
+
+# Function to split a node at the city with the most tree edges. With e1, e2 two of its tree edges
+# that are still free, the children are: e1 forbidden; e1 required and e2 forbidden; both required
+# (the last two merge into one child when the city already has a required edge)
+def branch_children(tree, forbidden, required):
+    degree, edges, reduced = tree[1], tree[2], tree[7]
+    for city in np.argsort(-degree, kind="stable"):
+        if degree[city] <= 2:
+            break
+        free = [int(j) for j in np.concatenate([edges[edges[:, 0] == city, 1], edges[edges[:, 1] == city, 0]])
+                if not required[city, j] and not forbidden[city, j]]
+        if len(free) >= 2:
+            break
+    free.sort(key=lambda j: reduced[city, j])
+    e1, e2 = free[0], free[1]
+
+    children = []
+    child = (forbidden.copy(), required.copy())
+    if forbid_edge(*child, city, e1):
+        children.append(child)
+    if required[city].sum() == 1:
+        child = (forbidden.copy(), required.copy())
+        if require_edge(*child, city, e1):
+            children.append(child)
+        return children
+    child = (forbidden.copy(), required.copy())
+    if require_edge(*child, city, e1) and forbid_edge(*child, city, e2):
+        children.append(child)
+    child = (forbidden.copy(), required.copy())
+    if require_edge(*child, city, e1) and require_edge(*child, city, e2):
+        children.append(child)
+    return children
+
+# Function to branch a node, returns its children that survive bounding, lowest bound first
+def expand(adj, costs, node, final_res, final_path, gap, stats, report=None):
+    bound, pi, tree, forbidden, required = node
+    children = []
+    for child_forbidden, child_required in branch_children(tree, forbidden, required):
+        child_bound, child_pi, child_tree = evaluate(adj, costs, pi, child_forbidden, child_required, final_res, final_path, gap, NODE_ITERATIONS, NODE_STEP, stats, report)
+        if child_tree is None:
+            stats["pruned"] += 1
+        else:
+            children.append((child_bound, child_pi, child_tree, child_forbidden, child_required))
+    children.sort(key=lambda child: child[0])
+    return children
+
+# Function to search depth first from a stack of bounded nodes, lowest bound child first,
+# until the stack is empty or token (Anytime.CancelToken) is cancelled
+def search(adj, costs, stack, final_res, final_path, gap, stats, token=None, report=None):
+    trace = Instrument.active()
+    popped = 0
+    while stack and not Anytime.stopped(token):
+        if trace is not None and popped % SAMPLE_NODES == 0:
+            trace.sample("branch_and_bound", nodes=stats["nodes"], pruned=stats["pruned"], open=len(stack), incumbent=final_res[0])
+        popped += 1
+        node = stack.pop()
+        if node[0] > final_res[0] - gap + BOUND_TOLERANCE:
+            stats["pruned"] += 1
+            continue
+        stack.extend(expand(adj, costs, node, final_res, final_path, gap, stats, report)[::-1])
 
-            if current_bound + current_weight < final_res[0]:
-                current_path[level] = i
-                visited[i] = True
+# The incumbent cost in shared memory, so every worker prunes against the best tour any of them
+# has found. Indexing matches the final_res list the single process search uses
+class SharedIncumbent:
+    def __init__(self, value):
+        self.value = value # multiprocessing.Value("d")
 
-                tsp_rec(adj, current_bound, current_weight, level + 1, current_path, visited, final_res, final_path)
+    def __getitem__(self, index):
+        return self.value.value
 
-            current_weight -= adj[current_path[level - 1]][i]
-            current_bound = temp
+    def __setitem__(self, index, cost):
+        with self.value.get_lock():
+            if cost < self.value.value:
+                self.value.value = cost
 
-            visited = [False] * N
-            for j in range(level):
-                if current_path[j] != -1:
-                    visited[current_path[j]] = True
+WORKER = {} # set in every worker process by init_worker
+
+def init_worker(adj, costs, incumbent, gap, token=None):
+    WORKER["adj"] = adj
+    WORKER["costs"] = costs
+    WORKER["final_res"] = SharedIncumbent(incumbent)
+    WORKER["gap"] = gap
+    WORKER["token"] = token
+
+# Worker: search one subtree to the end (or until the token is cancelled), returns the best tour it found (empty if none) and its counts
+def search_subproblem(node):
+    final_path = []
+    stats = {"nodes": 0, "pruned": 0, "fixed": 0}
+    search(WORKER["adj"], WORKER["costs"], [node], WORKER["final_res"], final_path, WORKER["gap"], stats, WORKER["token"])
+    return final_path, stats
+
+# Function to expand the tree breadth first until it is split_depth levels deep or has count open nodes
+def split_tree(adj, costs, root, final_res, final_path, gap, stats, count, split_depth=None, token=None, report=None):
+    frontier = [root]
+    depth = 0
+    while frontier and len(frontier) < count and (split_depth is None or depth < split_depth) and not Anytime.stopped(token):
+        next_frontier = []
+        for node in frontier:
+            if Anytime.stopped(token):
+                break
+            if node[0] > final_res[0] - gap + BOUND_TOLERANCE:
+                stats["pruned"] += 1
+            else:
+                next_frontier += expand(adj, costs, node, final_res, final_path, gap, stats, report)
+        frontier = next_frontier
+        depth += 1
+    frontier.sort(key=lambda node: node[0])
+    return frontier
+
+# Function to search the split subtrees on a process pool. Workers pull the next subtree off the
+# pool's task queue as soon as they finish one, best bound first, and share the incumbent cost.
+# Tours found by the workers are reported as their subtrees finish
+def parallel_search(adj, costs, root, final_res, final_path, gap, stats, workers, split_depth=None, token=None, report=None):
+    frontier = split_tree(adj, costs, root, final_res, final_path, gap, stats, workers * TASKS_PER_WORKER, split_depth, token, report)
+    if not frontier or Anytime.stopped(token):
+        return
+    incumbent = multiprocessing.Value("d", float(final_res[0]))
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(adj, costs, incumbent, gap, token)) as pool:
+        for path, worker_stats in pool.imap_unordered(search_subproblem, frontier):
+            for key, value in worker_stats.items():
+                stats[key] += value
+            if path:
+                cost = DistanceMatrix.route_cost(path[:-1], adj)
+                if cost < final_res[0]:
+                    final_res[0] = cost
+                    final_path[:] = path
+                    if report is not None:
+                        report(path[:-1], cost)
 
 # Main TSP solver using Branch and Bound
-def solve_tsp_branch_bound(adj):
+# parallel=True splits the tree into subtrees (split_depth levels deep, or enough for every worker)
+# and searches them on a process pool. Cancelling token (Anytime.CancelToken) stops the search and
+# returns the best tour so far, report(route, cost) is called with the first tour and every better one.
+# initial_route is a known tour to start from, its cost becomes the first upper bound
+def solve_tsp_branch_bound(adj, parallel=False, workers=None, split_depth=None, initial_route=None, token=None, report=None):
     begin_time = time.time() #start the timer
     N = len(adj)
-    current_bound = 0
-    current_path = [-1] * (N + 1)
-    visited = [False] * N
+    stats = {"nodes": 0, "pruned": 0, "fixed": 0}
 
-    final_res = [np.inf]
-    final_path = [-1] * (N + 1)
+    if N < 4:
+        final_path = list(range(N)) + [0]
+        if report is not None:
+            report(final_path[:N], DistanceMatrix.route_cost(final_path[:N], adj))
+        end_time = time.time()
+        stats["root_bound"] = stats["nodes_per_second"] = 0
+        return DistanceMatrix.route_cost(final_path[:N], adj), final_path, begin_time, end_time, stats
 
-    for i in range(N):
-        current_bound += (first_min(adj, i) + second_min(adj, i))
+    # start from a good tour, the subgradient steps and the pruning are both measured against it
+    with Instrument.phase("initial_incumbent"):
+        incumbent, incumbent_path = initial_incumbent(adj, initial_route)
+    final_res = [incumbent]
+    final_path = incumbent_path
+    if report is not None:
+        report(final_path[:-1], incumbent)
 
-    current_bound = np.ceil(current_bound / 2)
+    # with integer distances a better tour is at least 1 cheaper, so ties with the incumbent are pruned too
+    gap = 1 if np.issubdtype(np.asarray(adj).dtype, np.integer) else 1e-9
+    costs = np.array(adj, dtype=np.float64)
+    forbidden = np.eye(N, dtype=bool)
+    required = np.zeros((N, N), dtype=bool)
 
-    visited[0] = True
-    current_path[0] = 0
+    with Instrument.phase("root_bound"):
+        bound, pi, tree = evaluate(adj, costs, np.zeros(N), forbidden, required, final_res, final_path, gap, ROOT_ITERATIONS, ROOT_STEP, stats, report)
+    stats["root_bound"] = bound
+    if tree is not None:
+        root = (bound, pi, tree, forbidden, required)
+        with Instrument.phase("search"):
+            if parallel:
+                parallel_search(adj, costs, root, final_res, final_path, gap, stats, workers or os.cpu_count(), split_depth, token, report)
+            else:
+                search(adj, costs, [root], final_res, final_path, gap, stats, token, report)
 
-    tsp_rec(adj, current_bound, 0, 1, current_path, visited, final_res, final_path)
     end_time = time.time() #end the timer
-    return final_res[0], final_path, begin_time, end_time
+    stats["nodes_per_second"] = stats["nodes"] / max(end_time - begin_time, 1e-9)
+    trace = Instrument.active()
+    if trace is not None:
+        trace.add({"nodes": stats["nodes"], "pruned": stats["pruned"], "fixed": stats["fixed"]}, "bb.")
+    return final_res[0], final_path, begin_time, end_time, stats
 
 # Plotting the solution using matplotlib
 # Function to plot the route using matplotlib
@@ -124,9 +467,15 @@ def plot_route(cities, route, problem):
 if __name__ == "__main__":
     filename = "./tsplib-master/ulysses16.tsp"  # Replace with your TSP file path 
     adj_matrix, cities, problem = load_tsp_file(filename)
-    best_cost, best_route, begin_time, end_time = solve_tsp_branch_bound(adj_matrix)
+    best_cost, best_route, begin_time, end_time, stats = solve_tsp_branch_bound(adj_matrix)
     print("Total Cost:", best_cost)
     print("Number of Cities:", len(best_route))
     print("Optimal Path:", [cities[i] for i in best_route])
+    print("Parse Time:", problem.parse_time)
     print("Execution Time:", end_time - begin_time)
+    print("Nodes Expanded:", stats["nodes"])
+    print("Nodes Pruned:", stats["pruned"])
+    print("Edges Fixed:", stats["fixed"])
+    print("Root Bound:", stats["root_bound"])
+    print("Nodes per Second:", round(stats["nodes_per_second"]))
     plot_route(cities, best_route, problem)
@@ -1,44 +1,193 @@
-import tsplib95
 import numpy as np
 import random
 import itertools
+import math
+import os
+import multiprocessing
 import matplotlib.pyplot as plt
 import time
+import DistanceMatrix
+import BranchAndBound2
+import hillclimbing
+import Anytime
+import Instrument
 
 # Function to load a TSPLIB file and extract cities and distances
 def load_tsp_file(filename):
-    problem = tsplib95.load(filename)
-    cities = list(problem.get_nodes())
-    graph = {i: {j: problem.get_weight(i, j) for j in cities} for i in cities}
-    G = problem.get_graph()
+    problem, cities, graph = DistanceMatrix.load_tsp_file(filename)
     return cities, graph, problem
 
+SUFFIX_CITIES = 9 # the last cities of a tour are scored together, every ordering in one numpy batch
+SPLIT_DEPTH = 2 # length of the prefixes handed to the worker processes
+SAMPLE_BATCHES = 1000 # suffix batches between samples when instrumentation is on
+
 # Function to calculate the cost of the route
 def calculate_cost(route, graph):
-    total_cost = 0
-    num_cities = len(route)
-    for i in range(num_cities):
-        current_city = route[i]
-        next_city = route[(i + 1) % num_cities]  # Wrap around to the start of the route
-        total_cost += graph[current_city][next_city]
-    return total_cost
-
-def brute_force(cities, graph):
+    return DistanceMatrix.route_cost(route, graph) # wraps around to the start of the route
+
+PERMUTATION_TABLES = {}
+
+# Function to get every permutation of range(k) in lexicographic order, built once per k
+def permutation_table(k):
+    if k not in PERMUTATION_TABLES:
+        PERMUTATION_TABLES[k] = np.array(list(itertools.permutations(range(k))), dtype=np.int8).reshape(-1, k)
+    return PERMUTATION_TABLES[k]
+
+# Function to score the orderings of the remaining cities after the city last, back to city 0.
+# In lexicographic order the orderings sharing their first j cities are one block of (k-j)!
+# rows, so the path cost of each shared prefix is summed once for the whole block, and a block
+# is dropped as soon as its cost plus the bound on the rest of the tour reaches limit.
+# Returns the costs and orderings of the complete suffixes that are left
+def score_suffixes(graph, last, remaining, base, bounds, limit):
+    first, half = bounds
+    k = len(remaining)
+    table = permutation_table(k)
+    remaining = np.asarray(remaining)
+    rest = sum(half[c] for c in remaining) + first[0] / 2
+    alive = np.arange(k) # block number among the blocks sharing the first j+1 cities
+    cities = remaining[table[alive * math.factorial(k - 1), 0]]
+    cost = graph[last, cities]
+    used = half[cities]
+    for j in range(1, k):
+        keep = base + cost + first[cities] / 2 + rest - used < limit
+        width = k - j
+        alive = (alive[keep, None] * width + np.arange(width)).ravel()
+        cost = np.repeat(cost[keep], width)
+        used = np.repeat(used[keep], width)
+        rows = alive * math.factorial(k - j - 1)
+        cities = remaining[table[rows, j]]
+        cost += graph[remaining[table[rows, j - 1]], cities]
+        used += half[cities]
+    return cost + graph[cities, 0], remaining[table[alive]]
+
+# Function to search every tour starting with 0 then prefix, cutting a prefix off once its cost
+# plus a bound on the rest can't beat the best tour. The bound is half the two cheapest edges of
+# every city still to visit, plus half the cheapest edge of the two ends of the path.
+# On a symmetric matrix a tour and its mirror image cost the same, so only tours whose second city is
+# below their last are scored. Nothing more is searched once token (Anytime.CancelToken) is cancelled,
+# report(route, cost) gets every better tour
+def search_prefix(graph, prefix, prefix_cost, remaining, bounds, final_res, final_path, stats, token=None, report=None, symmetric=True):
+    if Anytime.stopped(token):
+        return
+    first, half = bounds
+    last = prefix[-1] if prefix else 0
+    if prefix:
+        bound = prefix_cost + (first[last] + first[0]) / 2 + sum(half[c] for c in remaining)
+        if bound >= final_res[0] or (symmetric and max(remaining) < prefix[0]):
+            stats["pruned"] += 1
+            return
+
+    if len(remaining) <= SUFFIX_CITIES:
+        stats["batches"] += 1
+        trace = Instrument.active()
+        if trace is not None and stats["batches"] % SAMPLE_BATCHES == 0:
+            trace.sample("brute_force", tours=stats["tours"], pruned=stats["pruned"], incumbent=final_res[0])
+        cost, order = score_suffixes(graph, last, remaining, prefix_cost, bounds, final_res[0])
+        if symmetric:
+            mirror = order[:, -1] > prefix[0] if prefix else order[:, 0] < order[:, -1]
+            cost, order = cost[mirror], order[mirror]
+        stats["tours"] += len(cost)
+        if len(cost) == 0:
+            return
+        best = int(np.argmin(cost))
+        if prefix_cost + cost[best] < final_res[0]:
+            final_res[0] = prefix_cost + cost[best].item()
+            final_path[:] = [0] + prefix + order[best].tolist()
+            if report is not None:
+                report(final_path, final_res[0])
+        return
+
+    for c in remaining:
+        rest = [r for r in remaining if r != c]
+        search_prefix(graph, prefix + [c], prefix_cost + graph[last, c].item(), rest, bounds, final_res, final_path, stats, token, report, symmetric)
+
+WORKER = {} # set in every worker process by init_worker
+
+def init_worker(graph, bounds, incumbent, token=None, symmetric=True):
+    WORKER["graph"] = graph
+    WORKER["symmetric"] = symmetric
+    WORKER["bounds"] = bounds
+    WORKER["final_res"] = BranchAndBound2.SharedIncumbent(incumbent)
+    WORKER["token"] = token
+
+# Worker: search every tour that starts with 0 then prefix, returns the best one it found (empty if none)
+def search_task(prefix):
+    graph = WORKER["graph"]
+    remaining = [c for c in range(1, len(graph)) if c not in prefix]
+    prefix_cost = graph[0, prefix[0]].item() + sum(graph[a, b].item() for a, b in zip(prefix, prefix[1:]))
+    final_path = []
+    stats = {"tours": 0, "pruned": 0, "batches": 0}
+    search_prefix(graph, list(prefix), prefix_cost, remaining, WORKER["bounds"], WORKER["final_res"], final_path, stats, WORKER["token"], symmetric=WORKER["symmetric"])
+    return final_path, stats
+
+# Function to find the optimal tour by enumeration. The tour starts at city 0, mirror images are
+# skipped when the matrix is symmetric, the last SUFFIX_CITIES cities are scored in numpy batches
+# and prefixes that can't beat the best tour so far (starting from a 2-opt tour) are cut.
+# parallel=True splits the search by prefix across a process pool that shares the best cost found so far.
+# Cancelling token (Anytime.CancelToken) stops the enumeration and returns the best tour so far,
+# report(route, cost) is called with the 2-opt tour and every better one.
+# initial_route is a known tour (e.g. from SolutionCache) that replaces the 2-opt tour when it is cheaper
+def brute_force(cities, graph, parallel=False, workers=None, initial_route=None, token=None, report=None):
     begin_time = time.time() #start the timer
+    graph = np.asarray(graph)
+    integer = np.issubdtype(graph.dtype, np.integer)
+    if integer:
+        graph = graph.astype(np.int64) # path sums can't overflow, other distances keep their type
+    n = len(graph)
+    if n < 4:
+        if report is not None:
+            report(list(range(n)), calculate_cost(list(range(n)), graph))
+        return list(range(n)), calculate_cost(list(range(n)), graph), begin_time, time.time()
+
+    # every city on a tour has two edges, each at least as cheap as its cheapest two. Taking the
+    # cheaper direction of every edge keeps that true for asymmetric matrices, which are searched
+    # without the mirror image skip
+    symmetric = np.array_equal(graph, graph.T)
+    costs = np.minimum(graph, graph.T).astype(np.float64)
+    np.fill_diagonal(costs, np.inf)
+    costs.sort(axis=1)
+    bounds = (costs[:, 0], (costs[:, 0] + costs[:, 1]) / 2)
+
+    with Instrument.phase("initial_tour"):
+        if symmetric:
+            route, cost = hillclimbing.local_search(list(range(n)), graph)
+        else: # 2-opt moves reverse segments, which changes the cost of an asymmetric tour
+            route, cost = list(range(n)), calculate_cost(list(range(n)), graph)
+    if initial_route is not None and calculate_cost(list(initial_route), graph) < cost:
+        route = [int(city) for city in initial_route]
+        cost = calculate_cost(route, graph)
+    # the 2-opt tour only prunes, the enumeration still finds the optimum itself. Float sums can
+    # differ in the last bits, so the margin above a float cost is relative
+    final_res = [cost + (1 if integer else 1e-9 * abs(cost) + 1e-9)]
+    final_path = []
+    stats = {"tours": 0, "pruned": 0, "batches": 0}
+    if report is not None:
+        report(route, cost)
+
+    trace = Instrument.active()
+    start = time.perf_counter()
+    if parallel and n - 1 > SUFFIX_CITIES + SPLIT_DEPTH:
+        tasks = [prefix for prefix in itertools.permutations(range(1, n), SPLIT_DEPTH)]
+        incumbent = multiprocessing.Value("d", float(final_res[0]))
+        with multiprocessing.Pool(workers or os.cpu_count(), initializer=init_worker, initargs=(graph, bounds, incumbent, token, symmetric)) as pool:
+            for path, worker_stats in pool.imap_unordered(search_task, tasks, chunksize=4):
+                for key, value in worker_stats.items():
+                    stats[key] += value
+                if path and calculate_cost(path, graph) < final_res[0]:
+                    final_res[0] = calculate_cost(path, graph)
+                    final_path = path
+                    if report is not None:
+                        report(final_path, final_res[0])
+    else:
+        search_prefix(graph, [], 0, list(range(1, n)), bounds, final_res, final_path, stats, token, report, symmetric)
+    if trace is not None:
+        trace.end_phase("enumeration", start)
+        trace.add(stats, "brute_force.")
 
-    # Generate all permutations of the cities and initialsie variables
-    all_permutations = itertools.permutations(cities) # a permutation
-    min_cost = float('inf') #inf used to
-    optimal_route = None
-
-    # Iterate over all permutations and calculate costs
-    for perm in all_permutations:
-        cost = calculate_cost(perm, graph)
-        if cost < min_cost:
-            min_cost = cost
-            optimal_route = perm
     end_time = time.time() #end the timer
-    return optimal_route, min_cost, begin_time, end_time
+    if not final_path: # stopped before the enumeration matched the 2-opt tour
+        return route, cost, begin_time, end_time
+    return final_path, final_res[0], begin_time, end_time
 
 
 # Function to plot the route using matplotlib
@@ -53,7 +202,7 @@ def plot_route(cities, route, problem):
         #plt.text(x + 20, y + 20, str(city), fontsize=12, color='black')
 
     # Plot the route
-    route_coords = [city_coords[city] for city in route]
+    route_coords = [city_coords[cities[city]] for city in route]
     route_x = [x for x, y in route_coords]
     route_y = [y for x, y in route_coords]
     
@@ -75,9 +224,10 @@ if __name__ == "__main__":
     filename = "./tsplib-master/burma14.tsp"  # Replace with your TSP file path
     cities, graph, problem = load_tsp_file(filename)
     best_route, best_distance, begin_time, end_time = brute_force(cities, graph)
-    print("Best Route: " , best_route)
+    print("Best Route: " , [cities[i] for i in best_route])
     print("Number of Cities: ", len(best_route))
     print("Total Cost: ", best_distance)
+    print("Parse Time: ", problem.parse_time, "seconds")
     print("Execution Time: ", (round(end_time - begin_time)), "seconds")
     # Plot the best route
     plot_route(cities, best_route, problem)
\ No newline at end of file
@@ -1,60 +1,237 @@
-import tsplib95
+import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 import time
+from collections import deque
+import DistanceMatrix
+import SpatialIndex
+import Instrument
+
+CANDIDATES = 10 # nearest neighbours used as the sparse graph for the tree and the matching
+MATCHING = "greedy" # "greedy" (greedy plus 2-opt on the pairs) or "blossom" (exact, small instances only)
 
 # Load TSPLIB file
 def load_tsp_file(filename):
-    problem = tsplib95.load(filename)
-    cities = list(problem.get_nodes())
-    graph = {i: {j: problem.get_weight(i, j) for j in cities} for i in cities}
-    G = problem.get_graph()
-    return cities, graph, problem, G
+    problem, cities, graph = DistanceMatrix.load_tsp_file(filename)
+    return cities, graph, problem
 
 # Cost calculation
 def calculate_cost(route, graph):
-    total_cost = 0
-    for i in range(len(route)):
-        current = route[i]
-        next_city = route[(i + 1) % len(route)]  # wrap around
-        total_cost += graph[current][next_city]
-    return total_cost
-
-# Christofides Algorithm
-def christofides_tsp(G):
+    return DistanceMatrix.route_cost(route, graph) # wraps around
+
+# Function to find the minimum spanning tree of a distance matrix with Prim's algorithm, one row at a time.
+# Returns the tree as two arrays of edge ends
+def prim_tree(graph):
+    n = len(graph)
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[0] = True
+    best = np.array(graph[0], dtype=np.float64)
+    best[0] = np.inf
+    link = np.zeros(n, dtype=np.int64)
+    u = np.empty(n - 1, dtype=np.int64)
+    for k in range(n - 1):
+        v = int(np.argmin(best))
+        u[k] = v
+        in_tree[v] = True
+        best[v] = np.inf
+        row = np.asarray(graph[v])
+        closer = ~in_tree & (row < best)
+        best[closer] = row[closer]
+        link[closer] = v
+    return u, link[u]
+
+# Function to find the root of a union-find set, halving the path as it goes
+def find(parent, a):
+    while parent[a] != a:
+        parent[a] = parent[parent[a]]
+        a = parent[a]
+    return a
+
+# Function to get every candidate edge once, as two arrays of ends with u < v
+def candidate_edges(candidates):
+    u = np.repeat(np.arange(len(candidates)), candidates.shape[1])
+    v = candidates.ravel().astype(np.int64)
+    edges = np.unique(np.column_stack([np.minimum(u, v), np.maximum(u, v)]), axis=0)
+    return edges[:, 0], edges[:, 1]
+
+# Function to find a spanning tree of coordinate instances with Kruskal's algorithm on the candidate
+# edges, which holds the minimum spanning tree unless a tree edge is longer than every candidate
+# edge of both its cities. Pieces left unconnected are joined by their shortest edge to the rest.
+# pair gives the distances between arrays of cities (DistanceMatrix.pair_distances)
+def candidate_tree(pair, candidates):
+    n = len(candidates)
+    u, v = candidate_edges(candidates)
+    weights = pair(u, v)
+    parent = list(range(n))
+    tree_u, tree_v = [], []
+    for k in np.argsort(weights, kind="stable").tolist():
+        a, b = find(parent, int(u[k])), find(parent, int(v[k]))
+        if a != b:
+            parent[a] = b
+            tree_u.append(int(u[k]))
+            tree_v.append(int(v[k]))
+
+    while len(tree_u) < n - 1:
+        roots = np.array([find(parent, a) for a in range(n)])
+        labels, sizes = np.unique(roots, return_counts=True)
+        piece = np.flatnonzero(roots == labels[np.argmin(sizes)])
+        outside = np.flatnonzero(roots != roots[piece[0]])
+        dist = np.array([pair(a, outside) for a in piece], dtype=np.float64)
+        i, j = np.unravel_index(np.argmin(dist), dist.shape)
+        a, b = int(piece[i]), int(outside[j])
+        parent[find(parent, a)] = find(parent, b)
+        tree_u.append(a)
+        tree_v.append(b)
+    return np.array(tree_u, dtype=np.int64), np.array(tree_v, dtype=np.int64)
+
+# Function to pair up the odd cities greedily, cheapest candidate edge first. Cities whose
+# candidates were all taken are then paired with the nearest city still unpaired
+def greedy_matching(pair, odd, candidates):
+    m = len(odd)
+    mate = np.full(m, -1, dtype=np.int64)
+    u, v = candidate_edges(candidates)
+    for k in np.argsort(pair(odd[u], odd[v]), kind="stable").tolist():
+        a, b = u[k], v[k]
+        if mate[a] < 0 and mate[b] < 0:
+            mate[a], mate[b] = b, a
+
+    left = np.flatnonzero(mate < 0)
+    while len(left):
+        a = left[0]
+        rest = left[1:]
+        b = rest[np.argmin(pair(odd[a], odd[rest]))]
+        mate[a], mate[b] = b, a
+        left = left[(left != a) & (left != b)]
+    return mate
+
+# Function to improve a matching with 2-opt: two pairs (a, b) and (c, d) with c near a are
+# swapped to (a, c), (b, d) or (a, d), (b, c) when that is cheaper, until nothing improves
+def improve_matching(pair, odd, mate, candidates):
+    d = lambda a, b: pair(odd[a], odd[b]).item() # raw distances, float matrices keep their fractions
+    mate = mate.tolist()
+    candidates = np.asarray(candidates).tolist()
+    queue = deque(range(len(mate)))
+    queued = [True] * len(mate)
+    while queue:
+        a = queue.popleft()
+        queued[a] = False
+        b = mate[a]
+        for c in candidates[a]:
+            e = mate[c]
+            if c == b:
+                continue
+            current = d(a, b) + d(c, e)
+            if d(a, c) + d(b, e) < current:
+                pairs = ((a, c), (b, e))
+            elif d(a, e) + d(b, c) < current:
+                pairs = ((a, e), (b, c))
+            else:
+                continue
+            for x, y in pairs:
+                mate[x], mate[y] = y, x
+            for x in (a, b, c, e):
+                if not queued[x]:
+                    queued[x] = True
+                    queue.append(x)
+            break
+    return np.array(mate, dtype=np.int64)
+
+# Function to find the minimum weight perfect matching exactly with networkx, O(n^3)
+def blossom_matching(graph, odd):
+    G = nx.Graph()
+    for i in range(len(odd)):
+        for j in range(i + 1, len(odd)):
+            G.add_edge(i, j, weight=graph.item(int(odd[i]), int(odd[j])))
+    mate = np.empty(len(odd), dtype=np.int64)
+    for a, b in nx.algorithms.matching.min_weight_matching(G):
+        mate[a], mate[b] = b, a
+    return mate
+
+# Function to walk an Eulerian circuit of a multigraph given as edge arrays (Hierholzer's algorithm).
+# Each city's edges are one slice of a sorted array, ptr marks the next edge to try
+def euler_circuit(n, u, v, start=0):
+    ends = np.concatenate([u, v])
+    order = np.argsort(ends, kind="stable")
+    other = np.concatenate([v, u])[order].tolist()
+    edge_id = np.tile(np.arange(len(u)), 2)[order].tolist()
+    bounds = np.searchsorted(ends[order], np.arange(n + 1)).tolist()
+    ptr = bounds[:-1]
+    used = bytearray(len(u))
+    stack = [start]
+    circuit = []
+    while stack:
+        city = stack[-1]
+        p, end = ptr[city], bounds[city + 1]
+        while p < end and used[edge_id[p]]:
+            p += 1
+        if p == end:
+            ptr[city] = p
+            circuit.append(stack.pop())
+        else:
+            ptr[city] = p + 1
+            used[edge_id[p]] = 1
+            stack.append(other[p])
+    return circuit
+
+# Christofides Algorithm, on the distance matrix (or memory-mapped store) directly.
+# Coordinate instances build the tree and the matching from nearest neighbour candidate lists.
+def christofides_tsp(graph, problem=None, cities=None, matching=MATCHING):
     begin_time = time.time()
+    n = len(graph)
+    coords = SpatialIndex.planar_coordinates(problem, cities) if problem is not None else None
+    pair = DistanceMatrix.pair_distances(problem, cities, graph)
+
     # Step 1: Minimum Spanning Tree
-    mst = nx.minimum_spanning_tree(G)
+    with Instrument.phase("spanning_tree"):
+        if coords is not None:
+            candidates = SpatialIndex.GridIndex(coords).candidate_lists(CANDIDATES)
+            tree_u, tree_v = candidate_tree(pair, candidates)
+        else:
+            tree_u, tree_v = prim_tree(graph)
 
     # Step 2: Find odd degree nodes
-    odd_nodes = [v for v, d in mst.degree() if d % 2 == 1] 
+    degree = np.bincount(np.concatenate([tree_u, tree_v]), minlength=n)
+    odd = np.flatnonzero(degree % 2 == 1)
 
     # Step 3: Minimum Weight Perfect Matching among odd degree nodes
-    subgraph = G.subgraph(odd_nodes)
-    matching = nx.algorithms.matching.min_weight_matching(subgraph, maxcardinality=True)
+    with Instrument.phase("matching"):
+        if matching == "blossom":
+            mate = blossom_matching(graph, odd)
+        else:
+            if coords is not None:
+                odd_candidates = SpatialIndex.GridIndex(coords[odd]).candidate_lists(CANDIDATES)
+            else:
+                odd_candidates = SpatialIndex.matrix_candidate_lists(np.asarray(graph)[np.ix_(odd, odd)], CANDIDATES)
+            mate = greedy_matching(pair, odd, odd_candidates)
+            mate = improve_matching(pair, odd, mate, odd_candidates)
+    first = np.flatnonzero(np.arange(len(odd)) < mate)
 
     # Step 4: Combine MST and Matching
-    eulerian_graph = nx.MultiGraph(mst)
-    eulerian_graph.add_edges_from(matching)
+    u = np.concatenate([tree_u, odd[first]])
+    v = np.concatenate([tree_v, odd[mate[first]]])
 
     # Step 5: Find Eulerian Circuit
-    euler_circuit = list(nx.eulerian_circuit(eulerian_graph))
+    with Instrument.phase("euler_circuit"):
+        circuit = euler_circuit(n, u, v)
 
     # Step 6: Shortcutting to TSP Tour
     tour = []
-    visited = set()
-    for u, v in euler_circuit:
-        if u not in visited:
-            tour.append(u)
-            visited.add(u)
+    visited = bytearray(n)
+    for city in circuit:
+        if not visited[city]:
+            tour.append(city)
+            visited[city] = 1
     tour.append(tour[0])
+    trace = Instrument.active()
+    if trace is not None:
+        trace.add({"tree_edges": len(tree_u), "odd": len(odd), "circuit": len(circuit)}, "christofides.")
     end_time = time.time()
     return tour, begin_time, end_time
 
 # Plotting function
-def plot_route(route, problem):
+def plot_route(cities, route, problem):
     coords = problem.node_coords
-    route_coords = [coords[city] for city in route]
+    route_coords = [coords[cities[city]] for city in route]
     x_vals = [x for x, y in route_coords]
     y_vals = [y for x, y in route_coords]
 
@@ -71,11 +248,12 @@ def plot_route(route, problem):
 # Main code
 if __name__ == "__main__":
     filename = "./tsplib-master/nrw1379.tsp"  # Change path accordingly
-    cities, graph, problem, G = load_tsp_file(filename)
-    route, begin_time, end_time = christofides_tsp(G)
+    cities, graph, problem = load_tsp_file(filename)
+    route, begin_time, end_time = christofides_tsp(graph, problem, cities)
     cost = calculate_cost(route, graph)
-    print("Best Route:", route)
+    print("Best Route:", [cities[i] for i in route])
     print("Number of Cities:", len(set(route)))
     print("Total Cost:", cost)
+    print("Parse Time:", problem.parse_time, "seconds")
     print("Execution Time:", round(end_time - begin_time), "seconds")
-    plot_route(route, problem)
+    plot_route(cities, route, problem)
@@ -0,0 +1,227 @@
+import itertools
+import math
+import numpy as np
+import tsplib95
+import TSPParser
+
+DTYPE = np.int32 # every TSPLIB distance fits in 32 bits and it halves the memory of int64
+ROW_BLOCK = 1024 # rows computed per broadcast so the float temporaries stay small
+DENSE_LIMIT = 10000 # above this many cities a dense matrix is too big, use the memory-mapped DistanceStore
+EARTH_RADIUS = 6378.388 # radius used by the TSPLIB GEO distance
+
+# Order the explicit weights are written in, as (triangle indices, diagonal offset)
+# The *_COL formats are the transposed *_ROW ones, which is the same thing for a symmetric matrix
+EXPLICIT_LAYOUTS = {
+    'LOWER_DIAG_ROW': (np.tril_indices, 0),
+    'LOWER_ROW': (np.tril_indices, -1),
+    'UPPER_DIAG_ROW': (np.triu_indices, 0),
+    'UPPER_ROW': (np.triu_indices, 1),
+    'UPPER_DIAG_COL': (np.tril_indices, 0),
+    'UPPER_COL': (np.tril_indices, -1),
+    'LOWER_DIAG_COL': (np.triu_indices, 0),
+    'LOWER_COL': (np.triu_indices, 1),
+}
+
+# Function to load a TSPLIB file and build the whole distance matrix in one go
+# store=None picks the memory-mapped store for big instances, True/False forces it on or off
+def load_tsp_file(filename, store=None):
+    problem = TSPParser.parse_tsp_file(filename)
+    if problem.edge_weight_type != 'EXPLICIT' and problem.edge_weight_type not in DISTANCE_FUNCTIONS:
+        problem = tsplib95.load(filename) # rare edge weight types are left to tsplib95
+        store = False
+    cities = list(problem.get_nodes())
+
+    if store or (store is None and len(cities) > DENSE_LIMIT):
+        import DistanceStore # imported here because it builds on this module
+        return DistanceStore.load_tsp_file(filename)
+
+    dist = distance_matrix(problem, cities)
+    return problem, cities, dist
+
+# Function to get the coordinates of the cities as an (n, 2) float array, None if there are none
+def node_coordinates(problem, cities):
+    if isinstance(problem, TSPParser.TSPInstance):
+        return problem.coords # already in the same order as problem.get_nodes()
+    if not problem.node_coords:
+        return None
+    return np.array([problem.node_coords[city] for city in cities], dtype=np.float64)
+
+# Distance functions, each one works on whole blocks of coordinates at once
+# and rounds exactly the same way tsplib95.distances does
+def euc_2d(start, end):
+    dx = end[..., 0] - start[..., 0]
+    dy = end[..., 1] - start[..., 1]
+    return np.floor(np.sqrt(dx * dx + dy * dy) + 0.5)
+
+def ceil_2d(start, end):
+    dx = end[..., 0] - start[..., 0]
+    dy = end[..., 1] - start[..., 1]
+    return np.ceil(np.sqrt(dx * dx + dy * dy))
+
+def att(start, end):
+    dx = end[..., 0] - start[..., 0]
+    dy = end[..., 1] - start[..., 1]
+    value = np.sqrt((dx * dx + dy * dy) / 10)
+    distance = np.floor(value + 0.5)
+    return distance + (distance < value) # pseudo euclidean always rounds up
+
+def geo(start, end): # start and end are already (latitude, longitude) in radians
+    q1 = np.cos(start[..., 1] - end[..., 1])
+    q2 = np.cos(start[..., 0] - end[..., 0])
+    q3 = np.cos(start[..., 0] + end[..., 0])
+    distance = EARTH_RADIUS * np.arccos(0.5 * ((1 + q1) * q2 - (1 - q1) * q3)) + 1
+    return np.trunc(distance)
+
+# Function to convert GEO coordinates (DDD.MM) into radians the way tsplib95 does
+def geo_radians(coords):
+    degrees = np.trunc(coords)
+    minutes = coords - degrees
+    return np.radians(degrees + minutes * 5 / 3)
+
+DISTANCE_FUNCTIONS = {
+    'EUC_2D': euc_2d,
+    'CEIL_2D': ceil_2d,
+    'ATT': att,
+    'GEO': geo,
+}
+
+# Function to build the distance matrix of a problem as a contiguous integer array
+def distance_matrix(problem, cities=None):
+    if cities is None:
+        cities = list(problem.get_nodes())
+
+    if problem.edge_weight_type == 'EXPLICIT':
+        return explicit_matrix(problem, len(cities))
+
+    func = DISTANCE_FUNCTIONS.get(problem.edge_weight_type)
+    coords = node_coordinates(problem, cities)
+    if func is None or coords is None:
+        if isinstance(problem, TSPParser.TSPInstance):
+            raise ValueError(f"Unsupported EDGE_WEIGHT_TYPE: {problem.edge_weight_type}")
+        # anything we do not have a vectorised formula for goes through tsplib95
+        return np.array([[problem.get_weight(i, j) for j in cities] for i in cities], dtype=DTYPE)
+
+    if problem.edge_weight_type == 'GEO':
+        coords = geo_radians(coords)
+    return coordinate_matrix(coords, func)
+
+# Function to get a function giving the distances between arrays of city indices. When the
+# distances are not an in-memory matrix, coordinate problems compute them from the coordinates,
+# which beats scattered reads of a memory-mapped store
+def pair_distances(problem, cities, dist):
+    func = DISTANCE_FUNCTIONS.get(problem.edge_weight_type) if problem is not None else None
+    coords = node_coordinates(problem, cities) if func is not None and not isinstance(dist, np.ndarray) else None
+    if coords is None:
+        return lambda u, v: np.asarray(dist[u, v])
+    if problem.edge_weight_type == 'GEO':
+        coords = geo_radians(coords)
+    return lambda u, v: func(coords[u], coords[v]).astype(DTYPE)
+
+# Exact rounding of the distance functions for one pair of plain floats, used by
+# CoordinateDistances.item where numpy's per-call overhead would dominate
+SCALAR_ROUNDING = {
+    'EUC_2D': lambda value: int(value + 0.5),
+    'CEIL_2D': math.ceil,
+}
+
+# Distances worked out from the coordinates whenever they are asked for, for instances too big
+# for any matrix. Same interface as DistanceStore (item, [u, v], [i], len) with nothing n by n stored
+class CoordinateDistances:
+    def __init__(self, problem, cities):
+        if problem.edge_weight_type not in DISTANCE_FUNCTIONS or node_coordinates(problem, cities) is None:
+            raise ValueError(f"Distances of {problem.edge_weight_type} problems can not be computed from coordinates")
+        self.func = DISTANCE_FUNCTIONS[problem.edge_weight_type]
+        self.geo = problem.edge_weight_type == 'GEO'
+        self.coords = self.convert(node_coordinates(problem, cities))
+        self.buffer = self.coords # room for cities added later, self.coords is the used part
+        self.points = self.coords.tolist()
+        self.rounding = SCALAR_ROUNDING.get(problem.edge_weight_type)
+        self.n = len(self.coords)
+        self.shape = (self.n, self.n)
+        self.dtype = np.dtype(DTYPE)
+
+    # Function to turn TSPLIB coordinates into the ones the distance function takes
+    def convert(self, coords):
+        coords = np.asarray(coords, dtype=np.float64)
+        return geo_radians(coords) if self.geo else coords
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            i, j = key
+            return self.func(self.coords[i], self.coords[j]).astype(DTYPE)
+        return self.func(self.coords[key], self.coords).astype(DTYPE)
+
+    # Function to get one distance as a plain int, same as ndarray.item(i, j)
+    def item(self, i, j):
+        if self.rounding is None:
+            return int(self.func(self.coords[i], self.coords[j]))
+        (x1, y1), (x2, y2) = self.points[i], self.points[j]
+        dx, dy = x2 - x1, y2 - y1
+        return self.rounding(math.sqrt(dx * dx + dy * dy))
+
+    # Functions for instances that change between runs (see Incremental): move a city, add one at
+    # the end, or remove one by moving the last city into its place. Each costs O(1) amortised
+    def set_point(self, i, coord):
+        self.coords[i] = self.convert([coord])[0]
+        self.points[i] = self.coords[i].tolist()
+
+    def append(self, coord):
+        if self.n == len(self.buffer):
+            self.buffer = np.concatenate([self.buffer, np.empty_like(self.buffer[:max(self.n, 16)])])
+        self.n += 1
+        self.coords = self.buffer[:self.n]
+        self.points.append(None)
+        self.shape = (self.n, self.n)
+        self.set_point(self.n - 1, coord)
+
+    def remove(self, i):
+        last = self.n - 1
+        self.coords[i] = self.coords[last]
+        self.points[i] = self.points[last]
+        self.points.pop()
+        self.n = last
+        self.coords = self.buffer[:self.n]
+        self.shape = (self.n, self.n)
+
+# Function to fill the matrix block by block using numpy broadcasting
+def coordinate_matrix(coords, func):
+    n = len(coords)
+    dist = np.empty((n, n), dtype=DTYPE)
+    for start in range(0, n, ROW_BLOCK):
+        stop = min(start + ROW_BLOCK, n)
+        dist[start:stop] = func(coords[start:stop, None, :], coords[None, :, :])
+    return dist
+
+# Function to expand the EDGE_WEIGHT_SECTION of an explicit problem into a full matrix
+def explicit_matrix(problem, n):
+    if isinstance(problem, TSPParser.TSPInstance):
+        weights = problem.edge_weights
+    else:
+        weights = np.fromiter(itertools.chain.from_iterable(problem.edge_weights), dtype=np.float64)
+    return expand_weights(weights, problem.edge_weight_format, n)
+
+# Function to scatter a flat list of weights into a symmetric matrix
+def expand_weights(weights, edge_weight_format, n):
+    weights = np.asarray(weights)
+    if edge_weight_format == 'FULL_MATRIX':
+        return np.ascontiguousarray(weights[:n * n].reshape(n, n), dtype=DTYPE)
+
+    if edge_weight_format not in EXPLICIT_LAYOUTS:
+        raise ValueError(f"Unsupported EDGE_WEIGHT_FORMAT: {edge_weight_format}")
+
+    triangle, k = EXPLICIT_LAYOUTS[edge_weight_format]
+    rows, cols = triangle(n, k)
+    dist = np.zeros((n, n), dtype=DTYPE)
+    dist[rows, cols] = weights[:len(rows)]
+    dist[cols, rows] = weights[:len(rows)]
+    return dist
+
+# Function to work out the cost of a route of city indices straight from the matrix,
+# an int for integer distances and a float otherwise
+def route_cost(route, dist):
+    route = np.asarray(route)
+    legs = np.asarray(dist[route, np.roll(route, -1)])
+    return legs.sum(dtype=np.int64 if np.issubdtype(legs.dtype, np.integer) else np.float64).item()
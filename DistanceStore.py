@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import DistanceMatrix
+import TSPParser
+
+BLOCK_ELEMENTS = 1 << 23 # distances computed per block while the store is being written
+GEO_MAX = int(DistanceMatrix.EARTH_RADIUS * np.pi + 1) # half way round the earth is as far as GEO goes
+
+# Upper triangle (diagonal included) of a symmetric distance matrix, packed row by row
+# into a memory-mapped file. Reads come back as DistanceMatrix.DTYPE so the solvers
+# can keep using graph[i][j], graph[i], graph[route, next_cities] and len(graph)
+class DistanceStore:
+    def __init__(self, path):
+        self.path = path
+        self.packed = np.load(path, mmap_mode="r") # np.memmap, the OS page cache is shared between processes
+        self.storage_dtype = self.packed.dtype
+        self.dtype = np.dtype(DistanceMatrix.DTYPE)
+        self.n = triangle_size(len(self.packed))
+        self.shape = (self.n, self.n)
+
+    def __len__(self):
+        return self.n
+
+    # processes get the file name, not a copy of the distances
+    def __reduce__(self):
+        return (DistanceStore, (self.path,))
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            i, j = key
+            return self.packed[self.index(i, j)].astype(self.dtype)
+        return self.row(key)
+
+    # Function to get the packed position of (i, j), works on scalars and arrays
+    def index(self, i, j):
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        low = np.minimum(i, j)
+        high = np.maximum(i, j)
+        return row_offset(low, self.n) + (high - low)
+
+    # Function to read one distance as a plain int, same as ndarray.item(i, j)
+    def item(self, i, j):
+        if i > j:
+            i, j = j, i
+        return int(self.packed[i * self.n - i * (i - 1) // 2 + j - i])
+
+    # Function to rebuild row i, the part right of the diagonal is one contiguous slice
+    def row(self, i):
+        i = int(i)
+        row = np.empty(self.n, dtype=self.dtype)
+        before = np.arange(i, dtype=np.int64)
+        row[:i] = self.packed[row_offset(before, self.n) + (i - before)]
+        start = row_offset(i, self.n)
+        row[i:] = self.packed[start:start + self.n - i]
+        return row
+
+    # Function to expand the whole matrix, only sensible for small instances
+    def to_dense(self):
+        return np.array([self.row(i) for i in range(self.n)], dtype=self.dtype).reshape(self.n, self.n)
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.to_dense()
+        return dense if dtype is None else dense.astype(dtype)
+
+# Function to get where row i starts in the packed upper triangle
+def row_offset(i, n):
+    return i * n - i * (i - 1) // 2
+
+# Function to get n back from the n(n+1)/2 length of the packed triangle
+def triangle_size(length):
+    n = int((np.sqrt(8 * length + 1) - 1) // 2)
+    while n * (n + 1) // 2 < length:
+        n += 1
+    return n
+
+# Function to pick the narrowest unsigned type that holds every distance
+def storage_dtype(max_distance):
+    for dtype in (np.uint16, np.uint32):
+        if max_distance <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+# Function to bound the largest distance without computing them all
+def max_distance_bound(problem, coords):
+    if coords is None:
+        return int(np.max(DistanceMatrix.distance_matrix(problem)))
+    if problem.edge_weight_type == "GEO":
+        return GEO_MAX
+    # every planar distance is at most the diagonal of the bounding box
+    func = DistanceMatrix.DISTANCE_FUNCTIONS[problem.edge_weight_type]
+    return int(func(coords.min(axis=0), coords.max(axis=0)))
+
+# Function to get the store path for a file, kept in the parser's sidecar cache folder
+def store_path(filename):
+    digest = TSPParser.file_digest(filename)
+    return TSPParser.cache_path(filename, digest)[:-len(".npz")] + ".dist.npy"
+
+# Function to open the store for a TSPLIB file, building it the first time
+def load_tsp_file(filename):
+    problem = TSPParser.parse_tsp_file(filename)
+    cities = list(problem.get_nodes())
+    path = store_path(filename)
+    if not os.path.exists(path):
+        build_store(problem, cities, path)
+    return problem, cities, DistanceStore(path)
+
+# Function to write the packed upper triangle of a problem to disk, block of rows by block of rows
+def build_store(problem, cities, path):
+    n = len(cities)
+    coords = None if problem.edge_weight_type == "EXPLICIT" else DistanceMatrix.node_coordinates(problem, cities)
+    dtype = storage_dtype(max_distance_bound(problem, coords))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp.npy"
+    packed = np.lib.format.open_memmap(temp_path, mode="w+", dtype=dtype, shape=(n * (n + 1) // 2,))
+
+    if coords is None:
+        dense = DistanceMatrix.distance_matrix(problem, cities) # explicit instances are small
+        packed[:] = dense[np.triu_indices(n)]
+    else:
+        func = DistanceMatrix.DISTANCE_FUNCTIONS[problem.edge_weight_type]
+        if problem.edge_weight_type == "GEO":
+            coords = DistanceMatrix.geo_radians(coords)
+        rows_per_block = max(1, BLOCK_ELEMENTS // n)
+        for start in range(0, n, rows_per_block):
+            stop = min(start + rows_per_block, n)
+            block = func(coords[start:stop, None, :], coords[None, start:, :])
+            upper = np.arange(n - start) >= np.arange(stop - start)[:, None] # columns at or right of the diagonal
+            packed[row_offset(start, n):row_offset(stop, n)] = block[upper]
+
+    packed.flush()
+    del packed
+    os.replace(temp_path, path)
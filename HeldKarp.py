@@ -1,67 +1,254 @@
-import tsplib95
+import numpy as np
 import math
+import os
+import shutil
+import tempfile
 import time
+import multiprocessing
 import matplotlib.pyplot as plt
+import DistanceMatrix
+import Instrument
+
+CHUNK = 1 << 18 # masks relaxed in one numpy call, bounds the size of the temporaries
+SHARED_DIR = "/dev/shm" # RAM backed folder the parallel dp layers are shared through, when it exists
 
 # Function to load a TSPLIB file, extracting both distance matrix and problem data
 def load_tsp_file(filename):
-    problem = tsplib95.load(filename)
-    cities = list(problem.get_nodes())
-    num_cities = len(cities)
-    distance_matrix = [[problem.get_weight(cities[i], cities[j]) for j in range(num_cities)] for i in range(num_cities)]
+    problem, cities, distance_matrix = DistanceMatrix.load_tsp_file(filename)
     return problem, cities, distance_matrix
 
-# Function to solve TSP using dynamic programming
-def tsp_dynamic_programming(filename):
-    begin_time = time.time() #start the timer
-    problem, cities, distances = load_tsp_file(filename)
+# Function to pick the dp dtype, int32 when no tour can get near its limit
+def dp_dtype(distances):
+    distances = np.asarray(distances)
+    if np.issubdtype(distances.dtype, np.integer) and int(distances.max()) * len(distances) < np.iinfo(np.int32).max // 2:
+        return np.dtype(np.int32)
+    return np.dtype(np.float64)
+
+# Function to work out how many bytes the dp and parent tables take for n cities
+def memory_needed(n, dtype=np.int32):
+    m = n - 1 # city 0 is always the start so it is left out of the masks
+    return (1 << m) * m * (np.dtype(dtype).itemsize + np.dtype(np.int8).itemsize)
 
-    #Step 1: Initialise the DP table
+# Function to get the masks of every popcount layer, masks are over cities 1..n-1
+def popcount_layers(m):
+    masks = np.arange(1 << m, dtype=np.int64)
+    counts = np.zeros(1 << m, dtype=np.int8)
+    for bit in range(m):
+        counts += (masks >> bit) & 1
+    order = np.argsort(counts, kind="stable")
+    bounds = np.searchsorted(counts[order], np.arange(m + 2))
+    return [order[bounds[k]:bounds[k + 1]] for k in range(m + 1)]
+
+# Function to relax every mask of one layer that contains city bit+1 as the last city.
+# dp[mask][b] = min over i of dp[mask without b][i] + distance(i, b), done for a chunk of masks at once
+def relax_layer(dp, parent, layer, distances, inf):
+    m = dp.shape[1]
+    for b in range(m):
+        ending = layer[(layer >> b) & 1 == 1]
+        column = distances[1:, b + 1].astype(np.int64) if dp.dtype.kind == "i" else distances[1:, b + 1]
+        for start in range(0, len(ending), CHUNK):
+            masks = ending[start:start + CHUNK]
+            previous = dp[masks ^ (1 << b)]
+            previous = previous.astype(np.int64) + column if dp.dtype.kind == "i" else previous + column
+            best = np.argmin(previous, axis=1)
+            values = previous[np.arange(len(masks)), best]
+            dp[masks, b] = np.minimum(values, inf)
+            parent[masks, b] = best
+
+# Function to solve the TSP exactly on a distance matrix, returns the cost and the tour as indices
+def held_karp(distances):
+    distances = np.asarray(distances)
     n = len(distances)
-    dp = [[math.inf] * n for _ in range(1 << n)] 
-    parent = [[None] * n for _ in range(1 << n)]
-
-    dp[1][0] = 0 
-
-    #Step 2: Fill the DP table
-    for mask in range(1 << n): 
-        for last_visited in range(n):
-            if not (mask & (1 << last_visited)):
-                continue
-            for next in range(n):
-                if mask & (1 << next):
-                    continue
-                new_mask = mask | (1 << next)
-                new_dist = dp[mask][last_visited] + distances[last_visited][next]
-                if new_dist < dp[new_mask][next]:
-                    dp[new_mask][next] = new_dist
-                    parent[new_mask][next] = last_visited
-
-    #Step 3: Find the minimum cost and reconstruct the path
-    min_cost = math.inf
-    end_city = None
-    full_mask = (1 << n) - 1 
-    for last_visited in range(1, n):
-        cost = dp[full_mask][last_visited] + distances[last_visited][0]
-        if cost < min_cost:
-            min_cost = cost
-            end_city = last_visited
-
-    #Step 4: Reconstruct the optimal path
+    if n == 1:
+        return 0, [0, 0]
+    m = n - 1
+    dtype = dp_dtype(distances)
+    inf = np.iinfo(dtype).max // 2 if dtype.kind == "i" else np.inf
+
+    #Step 1: Initialise the DP table, rows are masks of cities 1..n-1, columns the last city
+    dp = np.full((1 << m, m), inf, dtype=dtype)
+    parent = np.full((1 << m, m), -1, dtype=np.int8)
+    singles = 1 << np.arange(m)
+    dp[singles, np.arange(m)] = distances[0, 1:]
+
+    #Step 2: Fill the DP table a popcount layer at a time, each layer only reads the one before
+    layers = popcount_layers(m)
+    trace = Instrument.active()
+    for k in range(2, m + 1):
+        start = time.perf_counter()
+        relax_layer(dp, parent, layers[k], distances, inf)
+        if trace is not None:
+            trace.end_phase("layer", start)
+            trace.count("held_karp.masks", len(layers[k]))
+            trace.sample("held_karp", layer=k, masks=len(layers[k]))
+
+    #Step 3: Find the minimum cost and the last city before returning to city 0
+    full_mask = (1 << m) - 1
+    closing = dp[full_mask].astype(np.float64) + distances[1:, 0]
+    last = int(np.argmin(closing))
+    min_cost = closing[last]
+    min_cost = int(min_cost) if dtype.kind == "i" else float(min_cost)
+
+    #Step 4: Reconstruct the optimal path by walking the parent table backwards
     tour = []
     mask = full_mask
-    last_visited = end_city
-    while last_visited is not None:
-        tour.append(cities[last_visited])
-        new_last_visited = parent[mask][last_visited]
-        mask ^= (1 << last_visited)
-        last_visited = new_last_visited
-
-    # Step 5: Reverse the path to get the correct order
+    while last >= 0:
+        tour.append(last + 1)
+        previous = int(parent[mask, last])
+        mask ^= 1 << last
+        last = previous
+    tour.append(0)
     tour = tour[::-1]
-    tour.append(cities[0]) 
-    
-    # Step 6: Return the result and end timer
+    tour.append(0)
+    return min_cost, tour
+
+# Function to build the table of binomial coefficients C(c, j) used to rank masks within a layer
+def binomial_table(m):
+    return np.array([[math.comb(c, j) for j in range(m + 1)] for c in range(m + 1)], dtype=np.int64)
+
+# Function to get the position of each mask among the masks with the same popcount.
+# Sorted masks of one popcount are in colex order, so the combinatorial number system gives the index
+def rank_masks(masks, m, binomial):
+    rank = np.zeros(len(masks), dtype=np.int64)
+    count = np.zeros(len(masks), dtype=np.int64)
+    for bit in range(m):
+        is_set = (masks >> bit) & 1
+        count += is_set
+        rank += is_set * binomial[bit, count]
+    return rank
+
+# Function to turn ranks within the layer of popcount k back into masks
+def unrank_masks(ranks, k, m, binomial):
+    ranks = np.array(ranks, dtype=np.int64)
+    masks = np.zeros(len(ranks), dtype=np.int64)
+    for j in range(k, 0, -1):
+        c = np.searchsorted(binomial[:m, j], ranks, side="right") - 1
+        masks |= np.int64(1) << c
+        ranks -= binomial[c, j]
+    return masks
+
+# Function to get the bytes the parallel solver needs, in shared memory (two dp layers) and on disk (parents)
+def parallel_memory_needed(n, dtype=np.int32):
+    m = n - 1
+    itemsize = np.dtype(dtype).itemsize
+    shared = max(math.comb(m, k - 1) + math.comb(m, k) for k in range(1, m + 1)) * m * itemsize
+    disk = (1 << m) * m * np.dtype(np.int8).itemsize
+    return shared, disk
+
+# Worker: relax the masks with ranks lo..hi-1 of layer k, reading layer k-1 and writing layer k
+# and its parents straight into the memory-mapped files
+def relax_ranks(task):
+    k, lo, hi, m, distances, inf, previous_path, current_path, parent_path = task
+    binomial = binomial_table(m)
+    previous_dp = np.load(previous_path, mmap_mode="r")
+    current_dp = np.load(current_path, mmap_mode="r+")
+    parents = np.load(parent_path, mmap_mode="r+")
+
+    masks = unrank_masks(np.arange(lo, hi), k, m, binomial)
+    dp = np.full((hi - lo, m), inf, dtype=current_dp.dtype)
+    parent = np.full((hi - lo, m), -1, dtype=np.int8)
+    for b in range(m):
+        ending = np.flatnonzero((masks >> b) & 1)
+        if len(ending) == 0:
+            continue
+        previous_rank = rank_masks(masks[ending] ^ (1 << b), m, binomial)
+        previous = previous_dp[previous_rank]
+        previous = previous.astype(np.int64) + distances[1:, b + 1] if dp.dtype.kind == "i" else previous + distances[1:, b + 1]
+        best = np.argmin(previous, axis=1)
+        dp[ending, b] = np.minimum(previous[np.arange(len(ending)), best], inf)
+        parent[ending, b] = best
+
+    current_dp[lo:hi] = dp
+    parents[lo:hi] = parent
+    current_dp.flush()
+    parents.flush()
+
+# Function to solve the TSP exactly with each popcount layer split across a process pool.
+# Only two dp layers exist at a time, as memory-mapped files in SHARED_DIR that every worker
+# maps. The parent table of each finished layer is spilled to spill_dir for the path walk back.
+def held_karp_parallel(distances, workers=None, spill_dir=None):
+    distances = np.asarray(distances)
+    n = len(distances)
+    if n < 4:
+        return held_karp(distances)
+    m = n - 1
+    dtype = dp_dtype(distances)
+    inf = np.iinfo(dtype).max // 2 if dtype.kind == "i" else np.inf
+    workers = workers or os.cpu_count()
+    binomial = binomial_table(m)
+
+    shared_dir = tempfile.mkdtemp(prefix="heldkarp-", dir=SHARED_DIR if os.path.isdir(SHARED_DIR) else None)
+    spill_dir = tempfile.mkdtemp(prefix="heldkarp-", dir=spill_dir)
+    layer_path = lambda k: os.path.join(shared_dir, f"dp{k}.npy")
+    parent_path = lambda k: os.path.join(spill_dir, f"parent{k}.npy")
+    try:
+        # layer 1: only city b+1 visited after city 0, its rank is b
+        first = np.lib.format.open_memmap(layer_path(1), mode="w+", dtype=dtype, shape=(m, m))
+        first[:] = inf
+        first[np.arange(m), np.arange(m)] = distances[0, 1:]
+        first.flush()
+        del first
+        parents = np.lib.format.open_memmap(parent_path(1), mode="w+", dtype=np.int8, shape=(m, m))
+        parents[:] = -1
+        del parents
+
+        trace = Instrument.active()
+        with multiprocessing.Pool(workers) as pool:
+            for k in range(2, m + 1):
+                start = time.perf_counter()
+                size = math.comb(m, k)
+                np.lib.format.open_memmap(layer_path(k), mode="w+", dtype=dtype, shape=(size, m))
+                np.lib.format.open_memmap(parent_path(k), mode="w+", dtype=np.int8, shape=(size, m))
+                step = max(1, min(CHUNK, -(-size // workers)))
+                tasks = [(k, lo, min(lo + step, size), m, distances, inf, layer_path(k - 1), layer_path(k), parent_path(k)) for lo in range(0, size, step)]
+                pool.map(relax_ranks, tasks)
+                os.remove(layer_path(k - 1)) # layer k+1 only needs layer k
+                if trace is not None:
+                    trace.end_phase("layer", start)
+                    trace.count("held_karp.masks", size)
+                    trace.count("held_karp.tasks", len(tasks))
+                    trace.sample("held_karp", layer=k, masks=size)
+
+        # the full mask is the only mask of the last layer
+        closing = np.load(layer_path(m))[0].astype(np.float64) + distances[1:, 0]
+        last = int(np.argmin(closing))
+        min_cost = int(closing[last]) if dtype.kind == "i" else float(closing[last])
+
+        # walk back through the spilled parent layers
+        tour = []
+        mask = (1 << m) - 1
+        for k in range(m, 0, -1):
+            tour.append(last + 1)
+            rank = int(rank_masks(np.array([mask], dtype=np.int64), m, binomial)[0])
+            previous = int(np.load(parent_path(k), mmap_mode="r")[rank, last])
+            mask ^= 1 << last
+            last = previous
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    tour.append(0)
+    tour = tour[::-1]
+    tour.append(0)
+    return min_cost, tour
+
+# Function to solve TSP using dynamic programming
+# parallel=True splits every layer across worker processes and spills finished layers to disk.
+# The memory the tables need is printed before anything is allocated
+def tsp_dynamic_programming(filename, parallel=False, workers=None):
+    problem, cities, distances = load_tsp_file(filename)
+    begin_time = time.time() #start the timer, parsing is reported separately
+    dtype = dp_dtype(distances)
+    if parallel:
+        shared, disk = parallel_memory_needed(len(cities), dtype)
+        print("Held-Karp needs", round(shared / 2**20, 1), "MB of shared memory and", round(disk / 2**20, 1), "MB of disk")
+        min_cost, tour = held_karp_parallel(distances, workers)
+    else:
+        print("Held-Karp tables need", round(memory_needed(len(cities), dtype) / 2**20, 1), "MB")
+        min_cost, tour = held_karp(distances)
+    tour = [cities[i] for i in tour]
+
+    # Return the result and end timer
     end_time = time.time() #end the timer
     return problem, cities, tour, min_cost, begin_time, end_time
 
@@ -90,5 +277,6 @@ if __name__ == "__main__":
     print("Best path:", best_path)
     print("Number of cities:", len(cities))
     print("Total cost:", min_cost)
+    print("Parse time:", problem.parse_time, "seconds")
     print("Execution time:", (end_time - begin_time), "seconds")
     plot_route(cities, best_path, problem)
@@ -0,0 +1,309 @@
+import math
+import time
+from collections import defaultdict
+import numpy as np
+import DistanceMatrix
+import SpatialIndex
+import Tour
+import NearestNeighbour
+import TSPParser
+import hillclimbing
+
+CANDIDATES = 8 # nearest neighbours kept for every city, as in the local search
+POINTS_PER_CELL = 2 # average number of cities in a grid cell when the grid is built
+
+# Grid of cities that cities can be added to, moved in and removed from in O(1). Cells are
+# dict entries so cities may land outside the area the grid was built for.
+# Points are planar (SpatialIndex.planar_points) and held in a buffer that grows by doubling
+class DynamicGrid:
+    def __init__(self, points, points_per_cell=POINTS_PER_CELL):
+        self.buffer = np.array(points, dtype=np.float64)
+        self.n = len(self.buffer)
+        span = np.ptp(self.buffer, axis=0)
+        span = np.maximum(span, span.max() / max(self.n, 1) + 1e-9) # cities on a line still get a 2D grid
+        self.cell_size = float(np.sqrt(span[0] * span[1] * points_per_cell / max(self.n, 1)))
+        self.cells = defaultdict(list)
+        for city, (cell_x, cell_y) in enumerate((self.buffer // self.cell_size).astype(np.int64).tolist()):
+            self.cells[cell_x, cell_y].append(city)
+
+    @property
+    def points(self):
+        return self.buffer[:self.n]
+
+    def cell(self, point):
+        return int(point[0] // self.cell_size), int(point[1] // self.cell_size)
+
+    def add(self, point):
+        if self.n == len(self.buffer):
+            self.buffer = np.concatenate([self.buffer, np.empty_like(self.buffer[:max(self.n, 16)])])
+        self.buffer[self.n] = point
+        self.cells[self.cell(point)].append(self.n)
+        self.n += 1
+
+    def move(self, city, point):
+        self.cells[self.cell(self.buffer[city])].remove(city)
+        self.buffer[city] = point
+        self.cells[self.cell(point)].append(city)
+
+    # Function to remove a city, the last city is renumbered to take its place
+    def remove(self, city):
+        last = self.n - 1
+        self.cells[self.cell(self.buffer[city])].remove(city)
+        if city != last:
+            members = self.cells[self.cell(self.buffer[last])]
+            members[members.index(last)] = city
+            self.buffer[city] = self.buffer[last]
+        self.n = last
+
+    # Function to get the cities in the square of cells within r cells of a cell
+    def window(self, cell_x, cell_y, r):
+        found = []
+        for x in range(cell_x - r, cell_x + r + 1):
+            for y in range(cell_y - r, cell_y + r + 1):
+                found += self.cells.get((x, y), ())
+        return found
+
+    # Function to get every city within radius of a point. Windows that would cover more cells
+    # than there are cities check every city instead
+    def within(self, point, radius):
+        r = int(math.ceil(radius / self.cell_size))
+        if (2 * r + 1) ** 2 > self.n:
+            found = np.arange(self.n)
+        else:
+            found = np.array(self.window(*self.cell(point), r), dtype=np.int64)
+        dist = ((self.points[found] - point) ** 2).sum(axis=1)
+        return found[dist <= radius * radius]
+
+    # Function to get the k nearest cities to a point, nearest first, leaving out exclude
+    def nearest(self, point, k, exclude=-1):
+        cell_x, cell_y = self.cell(point)
+        r = 1
+        while True:
+            if (2 * r + 1) ** 2 > 4 * self.n:
+                found = np.arange(self.n)
+            else:
+                found = np.array(self.window(cell_x, cell_y, r), dtype=np.int64)
+            found = found[found != exclude]
+            dist = ((self.points[found] - point) ** 2).sum(axis=1)
+            if len(found) >= k or len(found) == self.n - (0 <= exclude < self.n):
+                order = np.argsort(dist, kind="stable")[:k]
+                # anything outside the window is at least r cells away
+                if len(found) == self.n - (0 <= exclude < self.n) or dist[order[-1]] <= (r * self.cell_size) ** 2:
+                    return found[order].tolist()
+            r += 1
+
+# A tour of a coordinate instance that can be kept up to date as cities are added, removed and moved.
+# The distances come from the coordinates (DistanceMatrix.CoordinateDistances), so a change only
+# touches its own city, and the candidate lists are repaired only for cities near the change.
+# New cities go in by cheapest insertion between a candidate neighbour and its tour neighbour, then
+# local search starts from the cities next to the changes only, so the work follows the size of the
+# change. Cities are numbered 0..n-1 inside, the labels are what callers see
+class IncrementalTour:
+    def __init__(self, problem, cities, route=None, k=CANDIDATES):
+        self.edge_weight_type = problem.edge_weight_type
+        self.distances = DistanceMatrix.CoordinateDistances(problem, cities)
+        self.grid = DynamicGrid(SpatialIndex.planar_coordinates(problem, cities))
+        self.labels = list(cities)
+        self.index = {label: i for i, label in enumerate(self.labels)}
+        self.k = min(k, len(self.labels) - 1)
+        self.candidates = SpatialIndex.GridIndex(self.grid.points).candidate_lists(self.k).tolist()
+        self.kth = self.kth_distance().tolist() # planar distance from every city to its k-th candidate
+        self.reach = max(self.kth, default=0.0) # radius of the grid queries, set once
+        self.wide = set() # cities whose k-th candidate is further than reach, checked on every query
+        if route is None:
+            route = NearestNeighbour.space_filling_curve(self.distances, cities, problem)[0][:-1]
+            route = hillclimbing.local_search(route, self.distances, self.candidates)[0]
+        self.tour = Tour.make_tour(route) # two-level on large instances, so edits cost O(sqrt(n))
+        self.cost = self.tour.cost(self.distances)
+        self.queued = [False] * len(self.labels) # local search's queue flags, kept between updates
+
+    # Function to get the planar distance from each city (every city when None) to its k-th candidate,
+    # infinite for a city with fewer than k candidates as it takes in any city
+    def kth_distance(self, cities=None):
+        cities = np.arange(self.grid.n) if cities is None else np.asarray(cities, dtype=np.int64)
+        if self.k == 0:
+            return np.zeros(len(cities))
+        last = np.array([self.candidates[c][-1] if self.candidates[c] else c for c in cities.tolist()], dtype=np.int64)
+        dist = np.sqrt(((self.grid.points[cities] - self.grid.points[last]) ** 2).sum(axis=1))
+        short = np.array([len(self.candidates[c]) < self.k for c in cities.tolist()], dtype=bool)
+        return np.where(short, np.inf, dist)
+
+    # Function to record the k-th candidate distance of some cities after their lists changed
+    def update_reach(self, cities):
+        for c, dist in zip(cities, self.kth_distance(cities).tolist()):
+            self.kth[c] = dist
+            if dist > self.reach:
+                self.wide.add(c)
+            else:
+                self.wide.discard(c)
+
+    # Function to get every city that could have a city at point among its candidates: the cities
+    # within reach of it on the grid and the wide cities whose own k-th candidate is as far
+    def near(self, point):
+        found = self.grid.within(point, self.reach)
+        wide = [x for x in self.wide if ((self.grid.points[x] - point) ** 2).sum() <= self.kth[x] ** 2]
+        return np.union1d(found, np.array(wide, dtype=np.int64)) if wide else found
+
+    def planar(self, coord):
+        return SpatialIndex.planar_points(np.array([coord], dtype=np.float64), self.edge_weight_type)[0]
+
+    # Function to rebuild the candidate lists of some cities
+    def refresh(self, cities):
+        for c in cities:
+            self.candidates[c] = self.grid.nearest(self.grid.points[c], self.k, exclude=c)
+        self.update_reach(cities)
+
+    # Function to offer city c to the candidate lists of the cities around it, any city that has
+    # c nearer than its k-th candidate takes it in
+    def offer(self, c):
+        points = self.grid.points
+        near = self.near(points[c])
+        near = near[near != c]
+        last = [self.candidates[x][-1] if self.candidates[x] else c for x in near.tolist()]
+        closer = ((points[near] - points[c]) ** 2).sum(axis=1) < ((points[near] - points[last]) ** 2).sum(axis=1)
+        taken = []
+        for x in near[closer | (np.array(last) == c)].tolist():
+            if c in self.candidates[x]:
+                continue
+            listed = self.candidates[x]
+            dist = ((self.grid.points[listed + [c]] - self.grid.points[x]) ** 2).sum(axis=1)
+            if len(listed) < self.k or dist[-1] < dist[-2]:
+                order = np.argsort(dist, kind="stable")[:self.k]
+                self.candidates[x] = [(listed + [c])[i] for i in order.tolist()]
+                taken.append(x)
+        self.update_reach(taken)
+
+    # Function to get the cities near point that have c as a candidate
+    def listing(self, c, point):
+        return [x for x in self.near(point).tolist() if x != c and c in self.candidates[x]]
+
+    # Function to take the cost of city c's two tour edges off, as if its tour neighbours were
+    # joined, returns the neighbours
+    def unlink(self, c):
+        p, q = self.tour.prev(c), self.tour.next(c)
+        self.cost += self.distances.item(p, q) - self.distances.item(p, c) - self.distances.item(c, q)
+        return p, q
+
+    # Function to find where city c adds least to the tour: between a candidate neighbour a and the
+    # city before or after a. When c is still in the tour (placed) it is stepped over, so the place it
+    # is being moved from counts as the edge between its old neighbours.
+    # Returns (a, b, the city c goes right after, the added cost)
+    def cheapest_insertion(self, c, placed=False):
+        d = self.distances.item
+        best, best_delta = None, None
+        for a in self.candidates[c]:
+            for succ in (self.tour.next, self.tour.prev):
+                b = succ(a)
+                if placed and b == c:
+                    b = succ(c)
+                delta = d(a, c) + d(c, b) - d(a, b)
+                if best_delta is None or delta < best_delta:
+                    best, best_delta = (a, b, a if succ == self.tour.next else b), delta
+        return (*best, best_delta)
+
+    # Function to put city c right after city after, c is either new or being moved (placed)
+    def place(self, c, after, delta, placed=False):
+        if placed:
+            self.tour.relocate(c, after)
+        else:
+            self.tour.insert(c, after)
+        self.cost += delta
+
+    # Function to remove a city, returns the cities around the gap
+    def delete(self, label):
+        c = self.index.pop(label)
+        affected = list(self.unlink(c))
+        referrers = self.listing(c, self.grid.points[c])
+        last = self.grid.n - 1
+        last_referrers = self.listing(last, self.grid.points[last]) if c != last else []
+
+        # the last city takes number c everywhere
+        self.tour.remove(c)
+        self.distances.remove(c)
+        self.grid.remove(c)
+        self.candidates[c] = self.candidates[last]
+        self.candidates.pop()
+        self.kth[c] = self.kth[last]
+        self.kth.pop()
+        self.wide.discard(c)
+        if last in self.wide:
+            self.wide.remove(last)
+            if c != last:
+                self.wide.add(c)
+        self.labels[c] = self.labels[last]
+        self.labels.pop()
+        if c != last:
+            self.index[self.labels[c]] = c
+            for x in last_referrers:
+                self.candidates[x] = [c if y == last else y for y in self.candidates[x]]
+        rename = lambda x: c if x == last else x
+        self.refresh([rename(x) for x in referrers])
+        return [rename(x) for x in affected]
+
+    # Function to add a city with TSPLIB coordinates coord, returns it and its new tour neighbours
+    def insert(self, label, coord):
+        if label in self.index:
+            raise ValueError(f"city {label} is already in the tour")
+        c = self.grid.n
+        self.index[label] = c
+        self.labels.append(label)
+        self.distances.append(coord)
+        self.grid.add(self.planar(coord))
+        self.candidates.append([])
+        self.kth.append(np.inf)
+        self.refresh([c])
+        self.offer(c)
+        a, b, after, delta = self.cheapest_insertion(c)
+        self.place(c, after, delta)
+        return [c, a, b]
+
+    # Function to give a city new coordinates, returns it and its old and new tour neighbours
+    def move(self, label, coord):
+        c = self.index[label]
+        p, q = self.unlink(c)
+        old = self.grid.points[c].copy()
+        self.distances.set_point(c, coord)
+        self.grid.move(c, self.planar(coord))
+        self.refresh([c] + self.listing(c, old))
+        self.offer(c)
+        a, b, after, delta = self.cheapest_insertion(c, placed=True)
+        self.place(c, after, delta, placed=True)
+        return [p, q, c, a, b]
+
+    # Function to apply a change set and repair the tour. delete is a list of city labels, insert
+    # and move map labels to TSPLIB coordinates. Deletions go first, then moves, then insertions.
+    # Local search then runs from the cities next to the changes only.
+    # Returns the tour as city labels and its cost
+    def update(self, insert=None, delete=None, move=None):
+        begin_time = time.time()
+        affected = set()
+        for label in delete or ():
+            renamed = self.grid.n - 1 # the last city is about to become number index[label]
+            c = self.index[label]
+            affected = {c if x == renamed else x for x in affected if x != c}
+            affected.update(self.delete(label))
+        for label, coord in (move or {}).items():
+            affected.update(self.move(label, coord))
+        for label, coord in (insert or {}).items():
+            affected.update(self.insert(label, coord))
+        if len(self.tour) >= 5:
+            self.cost = hillclimbing.local_search(self.tour, self.distances, self.candidates, queue=sorted(affected), cost=self.cost,
+                                                  queued=self.queued, as_list=False)[1]
+        self.update_time = time.time() - begin_time
+        return self.route(), self.cost
+
+    # Function to get the tour as city labels
+    def route(self):
+        return [self.labels[c] for c in self.tour.to_list()]
+
+# Main Code
+if __name__ == "__main__":
+    filename = "./tsplib-master/berlin52.tsp"  # Replace with your TSP file path
+    problem = TSPParser.parse_tsp_file(filename)
+    cities = list(problem.get_nodes())
+    tour = IncrementalTour(problem, cities)
+    print("Starting Cost: ", tour.cost)
+    route, cost = tour.update(insert={53: (800.0, 400.0)}, delete=[cities[0]], move={cities[1]: (100.0, 100.0)})
+    print("Number of cities:", len(route))
+    print("Total Cost: ", cost)
+    print("Update Time: ", tour.update_time)
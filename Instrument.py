@@ -0,0 +1,107 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+SAMPLE_EVERY = 10000 # iterations between samples in the solvers' main loops
+
+ACTIVE = None # the Trace being recorded, None when instrumentation is off
+
+# Counters, phase timers and samples for one run. Solvers get it from active() and skip all of
+# their instrumentation when that is None, so switched off it costs one check per call site.
+# sample_hook(name, elapsed, values) is called with every sample as it is taken
+class Trace:
+    def __init__(self, name="run", sample_every=SAMPLE_EVERY, sample_hook=None):
+        self.name = name
+        self.sample_every = sample_every
+        self.sample_hook = sample_hook
+        self.begin = time.perf_counter()
+        self.counters = collections.Counter()
+        self.phase_totals = collections.defaultdict(float)
+        self.phase_calls = collections.Counter()
+        self.events = [] # (name, start, duration, depth) of every finished phase
+        self.samples = [] # (name, elapsed, values)
+        self.depth = 0
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    # Function to add a dict of counts at once, e.g. the stats dict B&B keeps anyway
+    def add(self, counts, prefix=""):
+        for name, value in counts.items():
+            self.counters[prefix + name] += value
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            self.end_phase(name, start)
+
+    # Function to record a phase that began at start (a time.perf_counter() value) and ends now,
+    # for code where a with block does not fit
+    def end_phase(self, name, start):
+        duration = time.perf_counter() - start
+        self.phase_totals[name] += duration
+        self.phase_calls[name] += 1
+        self.events.append((name, start - self.begin, duration, self.depth))
+
+    def sample(self, name, **values):
+        elapsed = time.perf_counter() - self.begin
+        self.samples.append((name, elapsed, values))
+        if self.sample_hook is not None:
+            self.sample_hook(name, elapsed, values)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "elapsed": time.perf_counter() - self.begin,
+            "counters": dict(self.counters),
+            "phases": {name: {"seconds": total, "calls": self.phase_calls[name]} for name, total in self.phase_totals.items()},
+            "samples": [{"name": name, "elapsed": elapsed, **values} for name, elapsed, values in self.samples],
+        }
+
+    # Function to write the summary (counters, phase totals and samples) as JSON
+    def save_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=1, default=float)
+
+    # Function to write the phases as complete events and the samples as counter tracks in the
+    # Chrome trace format, which chrome://tracing and Perfetto open directly
+    def save_chrome_trace(self, path):
+        pid, tid = os.getpid(), threading.get_ident() % 2**31
+        events = [{"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": pid, "tid": tid}
+                  for name, start, duration, depth in self.events]
+        for name, elapsed, values in self.samples:
+            numbers = {key: value for key, value in values.items() if isinstance(value, (int, float))}
+            events.append({"name": name, "ph": "C", "ts": elapsed * 1e6, "pid": pid, "tid": tid, "args": numbers})
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.name}})
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "otherData": {"counters": dict(self.counters)}}, file, default=float)
+
+# Function to get the trace being recorded, None when instrumentation is off
+def active():
+    return ACTIVE
+
+# Function to time a phase of the active trace, does nothing when instrumentation is off
+def phase(name):
+    return ACTIVE.phase(name) if ACTIVE is not None else contextlib.nullcontext()
+
+# Record everything the solvers run inside the with block into a new Trace:
+#     with Instrument.tracing("berlin52 sa") as trace:
+#         SimulatedAnnealing.simulated_annealing(...)
+#     trace.save_chrome_trace("berlin52-sa.trace.json")
+@contextlib.contextmanager
+def tracing(name="run", sample_every=SAMPLE_EVERY, sample_hook=None):
+    global ACTIVE
+    previous = ACTIVE
+    ACTIVE = Trace(name, sample_every, sample_hook)
+    try:
+        yield ACTIVE
+    finally:
+        ACTIVE = previous
@@ -0,0 +1,221 @@
+import numpy as np
+import random
+import matplotlib.pyplot as plt
+import time
+from collections import deque
+import DistanceMatrix
+import SpatialIndex
+import NearestNeighbour
+import hillclimbing
+import Tour
+import Anytime
+import Instrument
+
+CANDIDATES = 8 # neighbours tried for each new edge
+MAX_DEPTH = 50 # longest chain of 2-opt moves in one LK step
+BREADTH = 3 # alternatives tried for the first new edge before giving up on t1
+KICK_WINDOW = 50 # the three double bridge cuts are made within this many positions
+SAMPLE_KICKS = 100 # kicks between samples when instrumentation is on
+
+# Function to load a TSPLIB file and extract cities and distances
+def load_tsp_file(filename):
+    problem, cities, graph = DistanceMatrix.load_tsp_file(filename)
+    return cities, graph, problem
+
+def calculate_cost(route, graph):
+    return DistanceMatrix.route_cost(route, graph) # wraps around to the start of the route
+
+# Function to run one LK chain from the tour edge (t1, t2). Each level removes the edge
+# (t1, t2), adds (t2, t3) and removes (t3, t4) as a 2-opt move that leaves (t4, t1) closing
+# the tour, then carries on from t4. The chain is cut back to its best prefix afterwards
+# by rolling the tour's journal back.
+# first picks which of the ranked first level choices to take, so the caller can backtrack.
+# Returns (gain, cities whose edges changed), or (0, None) with the tour unchanged.
+def lk_chain(t1, t2, tour, d, candidates, first=0, max_depth=MAX_DEPTH):
+    mark = len(tour.journal)
+    touched = [t1, t2]
+    added = set()
+    G = d(t1, t2) # removed minus added so far, not counting the closing edge
+    best_gain, best_length = 0, 0
+
+    for depth in range(max_depth):
+        pred = tour.prev if tour.next(t1) == t2 else tour.next
+        options = []
+        for t3 in candidates[t2]:
+            g1 = G - d(t2, t3)
+            if g1 <= 0:
+                break # candidates are sorted so nothing further on is positive
+            if t3 == t1:
+                continue
+            t4 = pred(t3)
+            if t4 == t2 or (min(t3, t4), max(t3, t4)) in added:
+                continue
+            options.append((d(t3, t4) - d(t2, t3), t3, t4, g1))
+        if depth == 0:
+            options.sort(reverse=True)
+            if first >= len(options):
+                return 0, None
+            choice = options[first]
+        elif options:
+            choice = max(options)
+        else:
+            break
+
+        _, t3, t4, g1 = choice
+        tour.two_opt_move(t1, t2, t3, t4)
+        added.add((min(t2, t3), max(t2, t3)))
+        touched += [t3, t4]
+        G = g1 + d(t3, t4)
+        gain = G - d(t4, t1)
+        if gain > best_gain:
+            best_gain, best_length = gain, depth + 1
+        t2 = t4
+
+    tour.undo(mark + best_length)
+    if best_gain > 0:
+        return best_gain, touched[:2 + 2 * best_length]
+    return 0, None
+
+# Function to run LK steps until no city in the queue finds an improving chain
+def lk_optimise(tour, d, candidates, queue, cost, breadth=BREADTH, token=None):
+    chains = improving = 0
+    queued = [False] * len(tour)
+    for city in queue:
+        queued[city] = True
+    while queue and not Anytime.stopped(token):
+        t1 = queue.popleft()
+        queued[t1] = False
+        improved = True
+        while improved:
+            improved = False
+            for succ in (tour.next, tour.prev):
+                t2 = succ(t1)
+                for first in range(breadth):
+                    gain, touched = lk_chain(t1, t2, tour, d, candidates, first)
+                    chains += 1
+                    if touched is not None:
+                        break
+                if touched is not None:
+                    improving += 1
+                    cost -= gain
+                    for city in touched:
+                        if not queued[city]:
+                            queued[city] = True
+                            queue.append(city)
+                    improved = True
+                    break
+    trace = Instrument.active()
+    if trace is not None:
+        trace.add({"chains": chains, "improving_chains": improving}, "lk.")
+    return cost
+
+# Function to apply a random double bridge kick inside a small window of the tour,
+# A B C D becomes A C B D with B and C short, made as three 2-opt moves so it can be undone.
+# Returns the change in cost and the cities at the cuts
+def double_bridge(tour, d, window=KICK_WINDOW):
+    window = min(window, len(tour) - 2)
+    path = [random.randrange(len(tour))]
+    while len(path) < window + 2:
+        path.append(tour.next(path[-1]))
+    p1, p2 = sorted(random.sample(range(1, window + 1), 2))
+    a, b1, b2, c1, c2, e = path[0], path[1], path[p1], path[p1 + 1], path[p2], path[p2 + 1]
+    delta = d(a, c1) + d(c2, b1) + d(b2, e) - d(a, b1) - d(b2, c1) - d(c2, e)
+    tour.two_opt_move(a, b1, e, c2) # a c2..c1 b2..b1 e
+    tour.two_opt_move(a, c2, b2, c1) # a c1..c2 b2..b1 e
+    tour.two_opt_move(c2, b2, e, b1) # a c1..c2 b1..b2 e
+    return delta, [a, b1, b2, c1, c2, e]
+
+# Iterated Lin-Kernighan: LK to a local optimum, then double bridge kicks followed by LK on
+# the kicked area, keeping the new tour whenever it is no worse, until the time runs out.
+# A kick that makes things worse is undone through the tour's journal, not by copying the tour.
+# token (Anytime.CancelToken) stops the run early, report(route, cost) is called with every new best tour.
+# Without an initial_route the start is the grid nearest neighbour tour when problem has coordinates,
+# otherwise the greedy edge tour on the candidate edges, instead of a nearest neighbour scan of the matrix
+def lin_kernighan(cities, graph, initial_route=None, candidates=None, time_limit=60, max_kicks=None, token=None, report=None, problem=None):
+    begin_time = time.time()
+    n = len(cities)
+    if candidates is None:
+        candidates = SpatialIndex.matrix_candidate_lists(graph, CANDIDATES)
+    if initial_route is None and problem is not None and problem.edge_weight_type != "EXPLICIT":
+        initial_route = NearestNeighbour.tsp_nearest_neighbour(graph, cities, problem)[0]
+    elif initial_route is None:
+        initial_route = NearestNeighbour.greedy_edge(graph, cities)[0]
+    route = list(initial_route)[:n] # tours that repeat the start city at the end
+    if n < 8:
+        if report is not None:
+            report(route, calculate_cost(route, graph))
+        return route, calculate_cost(route, graph), begin_time, time.time()
+
+    # 2-opt and or-opt first, they are cheaper than LK at removing the obvious defects
+    tour = Tour.make_tour(route)
+    _, cost = hillclimbing.local_search(tour, graph, candidates, token=token)
+    candidates = np.asarray(candidates).tolist()
+    d = graph.item
+    tour.journal = []
+    with Instrument.phase("lk_optimise"):
+        cost = lk_optimise(tour, d, candidates, deque(tour.to_list()), cost, token=token)
+    if report is not None:
+        report(tour.to_list(), cost)
+
+    trace = Instrument.active()
+    best_cost = cost
+    kicks = accepted = improving = 0
+    with Instrument.phase("kicks"):
+        while time.time() - begin_time < time_limit and (max_kicks is None or kicks < max_kicks) and not Anytime.stopped(token):
+            if trace is not None and kicks % SAMPLE_KICKS == 0:
+                trace.sample("lin_kernighan", kicks=kicks, best=best_cost, accepted=accepted)
+            kicks += 1
+            tour.journal.clear()
+            delta, touched = double_bridge(tour, d)
+            cost = lk_optimise(tour, d, candidates, deque(touched), cost + delta, token=token)
+            if cost <= best_cost:
+                accepted += 1
+                if cost < best_cost:
+                    improving += 1
+                    if report is not None:
+                        report(tour.to_list(), cost)
+                best_cost = cost
+            else:
+                tour.undo(0)
+                cost = best_cost
+    if trace is not None:
+        trace.add({"kicks": kicks, "kicks_accepted": accepted, "kicks_improving": improving}, "lk.")
+    end_time = time.time()
+    return tour.to_list(), best_cost, begin_time, end_time
+
+# Function to plot the route using matplotlib
+def plot_route(cities, route, problem):
+    # Get the coordinates of the cities from the problem
+    city_coords = problem.node_coords
+
+    # Plot the route
+    route_coords = [city_coords[cities[city]] for city in route]
+    route_x = [x for x, y in route_coords]
+    route_y = [y for x, y in route_coords]
+
+    # Add the return to the starting city to complete the loop
+    route_x.append(route_x[0])
+    route_y.append(route_y[0])
+
+    plt.plot(route_x, route_y, 'r-', marker='o', markersize=5, label="Route")
+    plt.title("Lin-Kernighan Visualisation")
+    plt.xlabel("X-coordinate")
+    plt.ylabel("Y-coordinate")
+    plt.grid(False)
+    plt.legend()
+    plt.show()
+
+# Parameters for Lin-Kernighan
+time_limit = 300 # seconds of iterated LK after the starting tour
+
+# Main Code
+if __name__ == "__main__":
+    filename = "./tsplib-master/d15112.tsp"  # Replace with your TSP file path
+    cities, graph, problem = load_tsp_file(filename)
+    candidates = SpatialIndex.candidate_lists(problem, cities, graph, CANDIDATES)
+    best_route, best_distance, begin_time, end_time = lin_kernighan(cities, graph, candidates=candidates, time_limit=time_limit, problem=problem)
+    print("Best Route: ", [cities[i] for i in best_route])
+    print("Total Cost: ", best_distance)
+    print("Parse Time: ", problem.parse_time)
+    print("Execution Time: ", ((end_time - begin_time)))
+    plot_route(cities, best_route, problem)
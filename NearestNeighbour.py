@@ -1,40 +1,193 @@
-import tsplib95
-import itertools
+import numpy as np
 import matplotlib.pyplot as plt
 import time
+import DistanceMatrix
+import SpatialIndex
+import Instrument
+import Christofides
+
+CANDIDATES = 10 # nearest neighbours each city offers as greedy edges
+CURVE_ORDER = 16 # the space-filling curve runs over a 2^16 by 2^16 grid
 
 def load_tsp_file(filename): #function to define file name
-    problem = tsplib95.load(filename) #loads file into problem variable
-    cities = list(problem.get_nodes()) #gets all the nodes storing thme in the cities variables
-    graph = {i: {j: problem.get_weight(i, j) for j in cities} for i in cities}
-    G = problem.get_graph()
+    problem, cities, graph = DistanceMatrix.load_tsp_file(filename) #loads file and builds the distance matrix
     return cities, graph, problem #returns variables for cities and graph
 
-def tsp_nearest_neighbour(graph, cities): #defines function for nearest neighbour algorithm
+# nearest neighbour from city 0. Problems with coordinates use a grid of the unvisited cities
+# (SpatialIndex.GridIndex) so each step only searches the rings of cells around the current city,
+# anything else scans its row of the distance matrix
+def tsp_nearest_neighbour(graph, cities, problem=None): #defines function for nearest neighbour algorithm
     begin_time = time.time() #start time
+    index = SpatialIndex.build_index(problem, cities) if problem is not None else None
+    if index is not None:
+        path = grid_nearest_neighbour(index)
+        total_cost = tour_cost(DistanceMatrix.pair_distances(problem, cities, graph), path)
+        return path, total_cost, begin_time, time.time()
+
     num_cities = len(cities) #gets the number of cities from the tsp file and then stores it in variable
-    start_city = cities[0] 
-    unvisited_cities = set(cities)  
-    unvisited_cities.remove(start_city) 
-    
+    start_city = 0 #routes are indices into the distance matrix
+    visited = np.zeros(num_cities, dtype=bool)
+    visited[start_city] = True
+
     current_city = start_city #starts at start city
     path = [start_city] 
     total_cost = 0 
 
-    while unvisited_cities: #while there are unvisited cities
-        nearest_city = min(unvisited_cities, key=lambda city: graph[current_city][city])
- #creates a temporary variable called lambda and sets it to the nearest city
-        total_cost += graph[current_city][nearest_city] 
+    for _ in range(num_cities - 1): #while there are unvisited cities
+        distances = np.where(visited, np.inf, np.asarray(graph[current_city], dtype=np.float64)) #works for integer and float matrices
+        nearest_city = int(np.argmin(distances)) #nearest unvisited city, ties go to the lowest index
+        total_cost += graph[current_city][nearest_city].item()
         path.append(nearest_city) 
-        unvisited_cities.remove(nearest_city) 
+        visited[nearest_city] = True
         current_city = nearest_city 
 
     # Return to the starting city
-    total_cost += graph[current_city][start_city] 
+    total_cost += graph[current_city][start_city].item()
     path.append(start_city)
     end_time = time.time() #end time
     return path, total_cost, begin_time, end_time
 
+# Function to get the cost of a path that ends back at its start, pair gives the distances (DistanceMatrix.pair_distances).
+# An int for integer distances and a float otherwise, as in DistanceMatrix.route_cost
+def tour_cost(pair, path):
+    path = np.asarray(path)
+    legs = np.asarray(pair(path[:-1], path[1:]))
+    return legs.sum(dtype=np.int64 if np.issubdtype(legs.dtype, np.integer) else np.float64).item()
+
+# Function to build the nearest neighbour path on a grid index, each visited city is removed from the grid
+def grid_nearest_neighbour(index, start_city=0):
+    index.remove(start_city)
+    path = [start_city]
+    current_city = start_city
+    while len(index):
+        current_city = index.pop_nearest(index.coords[current_city])
+        path.append(current_city)
+    path.append(start_city)
+    return path
+
+# greedy edge: take the candidate edges shortest first, skipping any that would give a city a third
+# edge or close a cycle (union-find). The paths left over are chained by nearest free end.
+def greedy_edge(graph, cities, problem=None, k=CANDIDATES):
+    begin_time = time.time()
+    n = len(cities)
+    with Instrument.phase("candidates"):
+        index = SpatialIndex.build_index(problem, cities) if problem is not None else None
+        if index is not None:
+            candidates = index.candidate_lists(k)
+        else:
+            candidates = SpatialIndex.matrix_candidate_lists(graph, k)
+        pair = DistanceMatrix.pair_distances(problem, cities, graph)
+        u, v = Christofides.candidate_edges(candidates)
+        order = np.argsort(pair(u, v), kind="stable")
+
+    degree = [0] * n
+    parent = list(range(n))
+    links = [[] for _ in range(n)]
+    added = 0
+    for a, b in zip(u[order].tolist(), v[order].tolist()):
+        if degree[a] == 2 or degree[b] == 2:
+            continue
+        root_a, root_b = Christofides.find(parent, a), Christofides.find(parent, b)
+        if root_a == root_b:
+            continue
+        parent[root_a] = root_b
+        degree[a] += 1
+        degree[b] += 1
+        links[a].append(b)
+        links[b].append(a)
+        added += 1
+        if added == n - 1:
+            break
+
+    with Instrument.phase("chain_fragments"):
+        path = chain_fragments(links, degree, index, graph)
+    path.append(path[0])
+    trace = Instrument.active()
+    if trace is not None:
+        trace.add({"candidate_edges": len(u), "edges_added": added, "fragments": n - added}, "greedy.")
+    end_time = time.time()
+    return path, tour_cost(pair, path), begin_time, end_time
+
+# Function to join the paths made by greedy_edge into one tour. From the end of the current path
+# the nearest free end of another path is found (on a grid of free ends when there are coordinates)
+# and that path is walked through to its other end
+def chain_fragments(links, degree, index, graph):
+    n = len(links)
+    ends = np.flatnonzero(np.array(degree) < 2)
+    if index is not None:
+        free = SpatialIndex.GridIndex(index.coords[ends])
+    else:
+        free = None
+        alive = np.ones(len(ends), dtype=bool)
+    slot = {int(city): i for i, city in enumerate(ends)}
+
+    def take(city):
+        if free is not None:
+            free.remove(slot[city])
+        else:
+            alive[slot[city]] = False
+
+    def walk(city):
+        previous, tour = -1, [city]
+        while True:
+            following = [c for c in links[city] if c != previous]
+            if not following:
+                return tour
+            previous, city = city, following[0]
+            tour.append(city)
+
+    start = int(ends[0]) if len(ends) else 0
+    path = []
+    city = start
+    for _ in range(n):
+        fragment = walk(city)
+        take(fragment[0])
+        if fragment[-1] != fragment[0]:
+            take(fragment[-1])
+        path += fragment
+        if len(path) == n:
+            break
+        last = fragment[-1]
+        if free is not None:
+            city = int(ends[free.nearest(index.coords[last])])
+        else:
+            remaining = np.flatnonzero(alive)
+            city = int(ends[remaining[np.argmin(np.asarray(graph[last])[ends[remaining]])]])
+    return path
+
+# Function to get the position of every point along a Hilbert curve over a 2^order grid
+def hilbert_index(coords, order=CURVE_ORDER):
+    side = 1 << order
+    low = coords.min(axis=0)
+    span = max(float((coords.max(axis=0) - low).max()), 1e-9)
+    x, y = (((coords - low) / span) * (side - 1)).astype(np.int64).T
+    d = np.zeros(len(coords), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve inside it runs the same way as the whole curve
+        flip = ~ry & rx
+        x = np.where(flip, s - 1 - x, x)
+        y = np.where(flip, s - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return d
+
+# space filling curve: visit the cities in the order a Hilbert curve passes them, O(n log n)
+def space_filling_curve(graph, cities, problem):
+    begin_time = time.time()
+    coords = SpatialIndex.planar_coordinates(problem, cities)
+    if coords is None:
+        raise ValueError("space filling curve tours need node coordinates")
+    path = np.argsort(hilbert_index(coords), kind="stable").tolist()
+    start = path.index(0)
+    path = path[start:] + path[:start] + [0]
+    end_time = time.time()
+    return path, tour_cost(DistanceMatrix.pair_distances(problem, cities, graph), path), begin_time, end_time
+
 
 # Function to plot the route using matplotlib
 def plot_route(cities, route, problem):
@@ -43,7 +196,7 @@ def plot_route(cities, route, problem):
 
 
     # Plot the route
-    route_coords = [city_coords [city] for city in route]
+    route_coords = [city_coords[cities[city]] for city in route]
     route_x = [x for x, y in route_coords]
     route_y = [y for x, y in route_coords]
     
@@ -64,10 +217,11 @@ if __name__ == "__main__": #main function
     filename = "./tsplib-master/att8.tsp" 
     cities, graph, problem = load_tsp_file(filename) 
 
-    best_path, min_cost, begin_time, end_time  = tsp_nearest_neighbour(graph, cities) 
-    print("Best path: ", best_path) 
+    best_path, min_cost, begin_time, end_time  = tsp_nearest_neighbour(graph, cities, problem) 
+    print("Best path: ", [cities[i] for i in best_path]) 
     print("Cities Visited: ", len(best_path))
     print("Minimum cost: ", min_cost)
+    print("Parse Time: ", problem.parse_time)
     print("Execution Time: ", (end_time - begin_time))
     # Plot the best route
     #plot_route(cities, best_path, problem)
\ No newline at end of file
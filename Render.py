@@ -0,0 +1,163 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+import TSPParser
+
+MARKER_LIMIT = 500 # cities are drawn as markers on tours up to this size
+RASTER_LIMIT = 20000 # bigger tours are drawn straight into a numpy image instead of as vector lines
+IMAGE_SIZE = 1600 # pixels along the longer side
+DPI = 100
+TOUR_COLOUR = (0.85, 0.1, 0.1)
+OPTIMAL_COLOUR = (0.55, 0.55, 0.55)
+TSP_DIR = "./tsplib-master"
+
+# Function to get the coordinates tours are drawn with, the display data when an instance only
+# has explicit weights. Rows are in the same order as problem.get_nodes()
+def plot_coordinates(problem):
+    coords = problem.coords if problem.coords is not None else problem.display
+    if coords is None:
+        raise ValueError(f"{problem.name} has no coordinates to draw")
+    return np.asarray(coords, dtype=np.float64)[:, :2]
+
+# Function to turn tour city labels into row indices of problem.get_nodes()
+def label_indices(problem, labels):
+    cities = np.asarray(problem.cities)
+    route = np.searchsorted(cities, labels)
+    if np.any(route >= len(cities)) or np.any(cities[np.minimum(route, len(cities) - 1)] != labels):
+        raise ValueError(f"the tour has cities that are not in {problem.name}")
+    return route
+
+# Function to get the tour's edges as an (n, 2, 2) array of segment end points, the route may
+# or may not repeat its start at the end
+def tour_segments(coords, route):
+    route = np.asarray(route, dtype=np.int64)
+    if len(route) > 1 and route[0] == route[-1]:
+        route = route[:-1]
+    points = coords[route]
+    return np.stack([points, np.roll(points, -1, axis=0)], axis=1)
+
+# Function to draw tours into an RGB image without matplotlib, every edge is sampled once per pixel
+# it crosses so the cost is the total drawn length rather than the number of cities.
+# layers is a list of (segments, colour), drawn in order so later tours end up on top
+def rasterise(layers, bounds, width, height):
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    (x0, y0), (x1, y1) = bounds
+    scale = np.array([(width - 1) / max(x1 - x0, 1e-12), (height - 1) / max(y1 - y0, 1e-12)])
+    for segments, colour in layers:
+        pixels = (segments - (x0, y0)) * scale
+        start, delta = pixels[:, 0], pixels[:, 1] - pixels[:, 0]
+        steps = np.ceil(np.abs(delta).max(axis=1)).astype(np.int64) + 1
+        edge = np.repeat(np.arange(len(steps)), steps)
+        offset = np.arange(len(edge)) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = offset / np.maximum(steps - 1, 1)[edge]
+        x = np.rint(start[edge, 0] + t * delta[edge, 0]).astype(np.int64)
+        y = np.rint(start[edge, 1] + t * delta[edge, 1]).astype(np.int64)
+        image[height - 1 - y, x] = np.round(np.array(colour) * 255).astype(np.uint8)
+    return image
+
+# Function to render a tour to an image file, the format comes from the file extension (png, svg, pdf).
+# Nothing is shown on screen, the figure is drawn off-screen and closed when written.
+# optimal is a second route drawn underneath in grey, e.g. the optimal tour to compare against.
+# Tours up to MARKER_LIMIT cities get markers, tours above RASTER_LIMIT are rasterised with numpy
+def render_route(filename, coords, route, optimal=None, title=None, markers=None, raster=None, size=IMAGE_SIZE):
+    coords = np.asarray(coords, dtype=np.float64)
+    n = len(coords)
+    markers = n <= MARKER_LIMIT if markers is None else markers
+    raster = n > RASTER_LIMIT if raster is None else raster
+    low, high = coords.min(axis=0), coords.max(axis=0)
+    span = np.maximum(high - low, 1e-12)
+    short = max(size // 4, int(size * span.min() / span.max())) # cities on a line still get a readable image
+    width, height = (size, short) if span[0] >= span[1] else (short, size)
+
+    layers = []
+    if optimal is not None:
+        layers.append((tour_segments(coords, optimal), OPTIMAL_COLOUR, "Optimal", 1.6))
+    layers.append((tour_segments(coords, route), TOUR_COLOUR, "Route", 0.6 if n > MARKER_LIMIT else 1.0))
+
+    figure = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    ax = figure.add_subplot()
+    if raster:
+        image = rasterise([(segments, colour) for segments, colour, _, _ in layers], (low, high), width, height)
+        ax.imshow(image, extent=(low[0], high[0], low[1], high[1]), interpolation="nearest", aspect="auto")
+    else:
+        for segments, colour, label, linewidth in layers:
+            ax.add_collection(LineCollection(segments, colors=[colour], linewidths=linewidth, label=label))
+        ax.autoscale_view()
+    if markers:
+        ax.scatter(coords[:, 0], coords[:, 1], s=8, c=[TOUR_COLOUR], zorder=3)
+    if title:
+        ax.set_title(title)
+    if optimal is not None and not raster:
+        ax.legend(loc="upper right")
+    ax.set_xlabel("X-coordinate")
+    ax.set_ylabel("Y-coordinate")
+    figure.tight_layout()
+    figure.savefig(filename)
+    figure.clear()
+
+# Function to render one saved .tour file. The instance comes from the NAME in the tour's header
+# (the part before the first dot, "pr2392.lin_kernighan.tour" is pr2392) unless tsp_file is given,
+# and optimal_file is a .tour file to overlay
+def render_tour_file(tour_file, output, tsp_file=None, optimal_file=None, tsp_dir=TSP_DIR, size=IMAGE_SIZE):
+    header, labels = TSPParser.read_tour_file(tour_file)
+    name = header.get("NAME") or os.path.basename(tour_file)
+    problem = TSPParser.parse_tsp_file(tsp_file or os.path.join(tsp_dir, name.split(".")[0] + ".tsp"))
+    route = label_indices(problem, labels)
+    optimal = None
+    if optimal_file is not None and os.path.exists(optimal_file):
+        optimal = label_indices(problem, TSPParser.read_tour_file(optimal_file)[1])
+    title = f"{name} ({header['COMMENT']})" if header.get("COMMENT") else name
+    render_route(output, plot_coordinates(problem), route, optimal, title, size=size)
+    return output
+
+# Worker: render one (tour_file, output, optimal_file, tsp_dir, size) task
+def render_task(task):
+    tour_file, output, optimal_file, tsp_dir, size = task
+    try:
+        return render_tour_file(tour_file, output, None, optimal_file, tsp_dir, size), None
+    except (OSError, ValueError) as error:
+        return output, f"{tour_file}: {error}"
+
+# Function to render every tour file into output_dir, one image per tour and format, on a process
+# pool unless there is only one worker. An optimal tour for instance NAME is looked for as
+# optimal_dir/NAME.opt.tour. Returns the files written and the errors
+def render_batch(tour_files, output_dir, formats=("png",), optimal_dir=None, tsp_dir=TSP_DIR, size=IMAGE_SIZE, workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    for tour_file in tour_files:
+        stem = os.path.basename(tour_file)
+        stem = stem[:-len(".tour")] if stem.endswith(".tour") else stem
+        optimal_file = os.path.join(optimal_dir, stem.split(".")[0] + ".opt.tour") if optimal_dir else None
+        for extension in formats:
+            tasks.append((tour_file, os.path.join(output_dir, f"{stem}.{extension}"), optimal_file, tsp_dir, size))
+    workers = min(workers or os.cpu_count(), len(tasks)) or 1
+    if workers == 1:
+        results = list(map(render_task, tasks))
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(render_task, tasks)
+    written = [output for output, error in results if error is None]
+    errors = [error for output, error in results if error is not None]
+    return written, errors
+
+# Main Code
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render saved .tour files to PNG/SVG without opening a window")
+    parser.add_argument("tours", nargs="+", help="tour files or globs, e.g. 'results/*.tour'")
+    parser.add_argument("--output", default="images/route visualisations", help="folder the images go to")
+    parser.add_argument("--formats", nargs="+", default=["png"], choices=["png", "svg", "pdf"])
+    parser.add_argument("--optimal-dir", help="folder with NAME.opt.tour files to overlay")
+    parser.add_argument("--tsp-dir", default=TSP_DIR)
+    parser.add_argument("--size", type=int, default=IMAGE_SIZE, help="pixels along the longer side")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    tour_files = sorted({path for pattern in args.tours for path in glob.glob(pattern)})
+    written, errors = render_batch(tour_files, args.output, args.formats, args.optimal_dir, args.tsp_dir, args.size, args.workers)
+    for error in errors:
+        print("Failed:", error)
+    print("Rendered", len(written), "images to", args.output)
@@ -1,9 +1,11 @@
 import numpy as np
+import math
 import random
-import tsplib95
-import itertools
 import matplotlib.pyplot as plt
 import time
+import DistanceMatrix
+import Anytime
+import Instrument
 
 
 # Set seed for reproducibility
@@ -13,59 +15,231 @@ random.seed(42)
 
 # Function to load a TSPLIB file and extract cities and distances
 def load_tsp_file(filename):
-    problem = tsplib95.load(filename)
-    cities = list(problem.get_nodes())
-    graph = {i: {j: problem.get_weight(i, j) for j in cities} for i in cities}
-    G = problem.get_graph()
+    problem, cities, graph = DistanceMatrix.load_tsp_file(filename)
     return cities, graph, problem
 
 def calculate_cost(route, graph):
-    total_cost = 0
-    n = len(route)
-    for i in range(n):
-        current_city = route[i]
-        next_city = route[(i + 1) % n]  # Wrap around to the start of the route
-        total_cost += graph[current_city][next_city]
-    return total_cost
+    return DistanceMatrix.route_cost(route, graph) # wraps around to the start of the route
 
 
 # Function to create a random initial route
 def create_initial_route(cities):
-    return random.sample(list(cities), len(cities))
-
-# Function to create neighboring solutions
-def get_neighbors(route):
-    neighbors = []
-    for i in range(len(route)):
-        for j in range(i + 1, len(route)):
-            neighbor = route.copy()
-            neighbor[i], neighbor[j] = neighbor[j], neighbor[i]
-            neighbors.append(neighbor)
-    return neighbors
-    
-def simulated_annealing(cities, graph, initial_temp, cooling_rate, max_iterations):
+    return random.sample(range(len(cities)), len(cities)) # routes are indices into the distance matrix
+
+# Moves the annealer picks from, each one is scored from the edges it changes only
+MOVES = ("swap", "2opt", "oropt")
+OR_OPT_MAX = 3 # longest segment an or-opt move relocates
+CHECK_EVERY = 256 # iterations between looks at the cancellation token
+
+# Function to score swapping the cities at positions i < j, O(1)
+def swap_delta(route, i, j, d):
+    n = len(route)
+    edges = {(i - 1) % n, i, (j - 1) % n, j} # edge k joins positions k and k+1
+    before = sum(d(route[k], route[(k + 1) % n]) for k in edges)
+    route[i], route[j] = route[j], route[i]
+    after = sum(d(route[k], route[(k + 1) % n]) for k in edges)
+    route[i], route[j] = route[j], route[i]
+    return after - before
+
+# Function to score reversing route[i..j] (2-opt), O(1)
+def two_opt_delta(route, i, j, d):
+    n = len(route)
+    if i == 0 and j == n - 1:
+        return 0 # reversing the whole tour gives the same tour
+    a, b = route[i - 1], route[i]
+    c, e = route[j], route[(j + 1) % n]
+    return d(a, c) + d(b, e) - d(a, b) - d(c, e)
+
+# Function to score moving route[i..i+length-1] between positions k and k+1, optionally reversed, O(1)
+def or_opt_delta(route, i, length, k, reverse, d):
+    n = len(route)
+    p, q = route[i - 1], route[(i + length) % n]
+    first, last = route[i], route[i + length - 1]
+    c, e = route[k], route[(k + 1) % n]
+    if reverse:
+        first, last = last, first
+    removed = d(p, route[i]) + d(route[i + length - 1], q) - d(p, q)
+    added = d(c, first) + d(last, e) - d(c, e)
+    return added - removed
+
+# Function to apply an or-opt move in place, O(n)
+def apply_or_opt(route, i, length, k, reverse):
+    segment = route[i:i + length]
+    if reverse:
+        segment.reverse()
+    del route[i:i + length]
+    k = k if k < i else k - length # position of city k once the segment is out
+    route[k + 1:k + 1] = segment
+
+# Function to pick one random move and its delta without building the neighbour
+def sample_move(route, moves, d):
+    n = len(route)
+    move = random.choice(moves)
+    if move == "swap" or n < 5:
+        i, j = sorted(random.sample(range(n), 2))
+        return "swap", (i, j), swap_delta(route, i, j, d)
+    if move == "2opt":
+        i, j = sorted(random.sample(range(n), 2))
+        return "2opt", (i, j), two_opt_delta(route, i, j, d)
+    length = random.randint(1, min(OR_OPT_MAX, n - 3))
+    i = random.randint(0, n - length)
+    k = random.randrange(n - length - 1) # any edge outside the segment except the one it sits on
+    k = (i + length + k) % n
+    reverse = random.random() < 0.5
+    return "oropt", (i, length, k, reverse), or_opt_delta(route, i, length, k, reverse, d)
+
+# Function to apply a sampled move to the route in place
+def apply_move(route, move, args):
+    if move == "swap":
+        i, j = args
+        route[i], route[j] = route[j], route[i]
+    elif move == "2opt":
+        i, j = args
+        route[i:j + 1] = route[i:j + 1][::-1]
+    else:
+        apply_or_opt(route, *args)
+
+# token (Anytime.CancelToken) stops the run early, report(route, cost) is called with every new best tour
+def simulated_annealing(cities, graph, initial_temp, cooling_rate, max_iterations, moves=MOVES, initial_route=None, token=None, report=None):
     begin_time = time.time()
-    current_route = create_initial_route(cities)
+    d = graph.item # distance lookup returning plain ints, much faster than graph[i][j]
+    current_route = list(initial_route) if initial_route is not None else create_initial_route(cities)
     current_distance = calculate_cost(current_route, graph)
     best_route = current_route.copy()
     best_distance = current_distance
     temperature = initial_temp
+    trace = Instrument.active()
+    accepted = uphill = improvements = iterations = 0
+
+    if report is not None:
+        report(best_route, best_distance)
+    if len(current_route) < 3:
+        return best_route, best_distance, begin_time, time.time() # every tour is the same
 
-    for _ in range(max_iterations):
-        neighbors = get_neighbors(current_route)
-        next_route = random.choice(neighbors)
-        next_distance = calculate_cost(next_route, graph)
+    for iteration in range(max_iterations):
+        if iteration % CHECK_EVERY == 0 and Anytime.stopped(token):
+            break
+        if trace is not None and iteration % trace.sample_every == 0:
+            trace.sample("annealing", temperature=temperature, cost=current_distance, best=best_distance, accepted=accepted)
+        iterations += 1
+        move, args, delta = sample_move(current_route, moves, d)
 
-        if next_distance < current_distance or random.random() < np.exp((current_distance - next_distance) / temperature): 
-            current_route, current_distance = next_route, next_distance
+        if delta < 0 or (temperature > 0 and random.random() < math.exp(-delta / temperature)):
+            apply_move(current_route, move, args)
+            current_distance += delta
+            accepted += 1
+            uphill += delta > 0
 
             if current_distance < best_distance:
-                best_route, best_distance = current_route, current_distance
+                best_route, best_distance = current_route.copy(), current_distance
+                improvements += 1
+                if report is not None:
+                    report(best_route, best_distance)
 
         temperature *= cooling_rate
+    if trace is not None:
+        trace.add({"iterations": iterations, "accepted": accepted, "uphill_accepted": uphill, "best_improvements": improvements}, "sa.")
     end_time = time.time()
     return best_route, best_distance, begin_time, end_time
 
+# Function to reverse tours[c, lo..hi] for a batch of chains at once. The other side of the
+# tour is reversed instead when it is shorter, which gives the same tour
+def reverse_batch(tours, chains, lo, hi):
+    n = tours.shape[1]
+    length = hi - lo + 1
+    outside = 2 * length > n
+    start = np.where(outside, hi + 1, lo)
+    length = np.where(outside, n - length, length)
+    rows = np.repeat(chains, length)
+    offset = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    first = np.repeat(start, length)
+    last = first + np.repeat(length, length) - 1
+    tours[rows, (first + offset) % n] = tours[rows, (last - offset) % n]
+
+# Function to swap the temperatures of neighbouring rungs of the ladder, rung r with r+1 for
+# every r of one parity, accepted with the usual parallel tempering probability
+def swap_temperatures(ladder, rung_temps, costs, parity, rng):
+    r = np.arange(parity, len(ladder) - 1, 2)
+    if len(r) == 0:
+        return
+    cold, hot = ladder[r], ladder[r + 1]
+    exponent = (costs[cold] - costs[hot]) * (1 / rung_temps[r] - 1 / rung_temps[r + 1])
+    swap = rng.random(len(r)) < np.exp(np.minimum(exponent, 0))
+    ladder[r[swap]], ladder[r[swap] + 1] = hot[swap], cold[swap]
+
+# Many annealing chains at once as one (chains, n) array of tours. Every step proposes a random
+# 2-opt move in every chain, scores them all from the four changed edges and applies the accepted
+# ones together, so a step costs a handful of numpy calls whatever the number of chains.
+# tempering=True gives each chain a fixed temperature on a geometric ladder from min_temp to
+# initial_temp instead of cooling, and every swap_interval steps neighbouring rungs swap chains
+# token and report work the same as in simulated_annealing
+def batched_annealing(cities, graph, chains=64, steps=100000, initial_temp=500, cooling_rate=0.9999,
+                      tempering=False, min_temp=1, swap_interval=100, initial_route=None, seed=None,
+                      token=None, report=None):
+    begin_time = time.time()
+    rng = np.random.default_rng(seed)
+    graph = np.asarray(graph)
+    n = len(cities)
+    if initial_route is not None:
+        tours = np.tile(np.asarray(initial_route[:n], dtype=np.int64), (chains, 1))
+    else:
+        tours = rng.permuted(np.tile(np.arange(n), (chains, 1)), axis=1)
+    # int64 sums for integer matrices, float64 otherwise, as in DistanceMatrix.route_cost
+    total = np.int64 if np.issubdtype(graph.dtype, np.integer) else np.float64
+    costs = graph[tours, np.roll(tours, -1, axis=1)].sum(axis=1, dtype=total)
+    best = int(np.argmin(costs))
+    best_route, best_distance = tours[best].copy(), costs[best].item()
+    if report is not None:
+        report(best_route, best_distance)
+    if n < 4:
+        return best_route.tolist(), best_distance, begin_time, time.time() # every tour is the same
+
+    if tempering:
+        rung_temps = np.geomspace(min_temp, initial_temp, chains)
+        ladder = np.arange(chains) # ladder[r] is the chain at rung r
+    temps = np.full(chains, float(initial_temp))
+    all_chains = np.arange(chains)
+    trace = Instrument.active()
+    accepted = steps_run = 0
+
+    for step in range(steps):
+        if Anytime.stopped(token):
+            break
+        if trace is not None and step % trace.sample_every == 0:
+            trace.sample("annealing", temperature=float(temps.mean()), cost=float(costs.mean()), best=best_distance, accepted=accepted)
+        steps_run += 1
+        # two different positions from 1..n-1, position 0 stays put so the move is never the whole tour
+        i = rng.integers(1, n, chains)
+        j = rng.integers(1, n - 1, chains)
+        j += j >= i
+        lo, hi = np.minimum(i, j), np.maximum(i, j)
+        a, b = tours[all_chains, lo - 1], tours[all_chains, lo]
+        c, e = tours[all_chains, hi], tours[all_chains, (hi + 1) % n]
+        delta = graph[a, c] + graph[b, e] - graph[a, b] - graph[c, e]
+
+        if tempering:
+            temps[ladder] = rung_temps
+        accept = (delta < 0) | (rng.random(chains) < np.exp(-np.maximum(delta, 0) / temps))
+        moved = np.flatnonzero(accept & (delta != 0))
+        accepted += len(moved)
+        if len(moved):
+            reverse_batch(tours, moved, lo[moved], hi[moved])
+            costs[moved] += delta[moved]
+            k = int(np.argmin(costs))
+            if costs[k] < best_distance:
+                best_route, best_distance = tours[k].copy(), costs[k].item()
+                if report is not None:
+                    report(best_route, best_distance)
+
+        if tempering:
+            if step % swap_interval == 0:
+                swap_temperatures(ladder, rung_temps, costs, (step // swap_interval) % 2, rng)
+        else:
+            temps *= cooling_rate
+    if trace is not None:
+        trace.add({"steps": steps_run, "moves": steps_run * chains, "accepted": accepted}, "batched.")
+    end_time = time.time()
+    return best_route.tolist(), best_distance, begin_time, end_time
 
 # Function to plot the route using matplotlib
 def plot_route(cities, route, problem):
@@ -79,7 +253,7 @@ def plot_route(cities, route, problem):
         #plt.text(x + 20, y + 20, str(city), fontsize=12, color='black')
 
     # Plot the route
-    route_coords = [city_coords[city] for city in route]
+    route_coords = [city_coords[cities[city]] for city in route]
     route_x = [x for x, y in route_coords]
     route_y = [y for x, y in route_coords]
     
@@ -97,15 +271,16 @@ def plot_route(cities, route, problem):
 
 # Parameters for Simulated Annealing
 initial_temp = 500
-cooling_rate = 0.95
-max_iterations = 200
+cooling_rate = 0.999995 # applied every iteration, so it has to be close to 1
+max_iterations = 2000000
 
 # Set name of file
 if __name__ == "__main__":
     filename = "./tsplib-master/ali535.tsp"  # Replace with your TSP file path
     cities, graph, problem = load_tsp_file(filename)
     best_route, best_distance, begin_time, end_time = simulated_annealing(cities, graph, initial_temp, cooling_rate, max_iterations)
-    print("Best Route: " , best_route)
+    print("Best Route: " , [cities[i] for i in best_route])
     print("Total Cost: ", best_distance)
+    print("Parse Time: ", problem.parse_time)
     print("Execution Time: ", ((end_time - begin_time)))
     plot_route(cities, best_route, problem)
\ No newline at end of file
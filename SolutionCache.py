@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+CACHE_DIR = "./tsplib-master/.solution_cache"
+MAX_BYTES = 256 * 2**20 # least recently used entries are removed once the cache is bigger than this
+CACHE_VERSION = 1 # bump when the entry layout changes so old entries are ignored
+
+# Function to hash what a solver actually sees of an instance: the weight type and format, the
+# dimension, the node labels, coordinates and explicit weights. The name and comment are left out,
+# so a renamed copy of a file still finds its tours
+def instance_digest(problem):
+    digest = hashlib.sha1()
+    for key in ("TYPE", "DIMENSION", "EDGE_WEIGHT_TYPE", "EDGE_WEIGHT_FORMAT"):
+        digest.update(f"{key}={problem.header.get(key)};".encode())
+    for array in (problem.coord_labels, problem.coords, problem.edge_weights):
+        if array is not None:
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+# Function to hash a tour, warm-started runs are cached under their seed tour's hash so they
+# never stand in for a run from scratch
+def route_digest(route):
+    return hashlib.sha1(np.asarray(route, dtype=np.int64).tobytes()).hexdigest()
+
+# On-disk cache of solved tours, one small JSON file per (instance, solver, params).
+# Reading an entry touches its file so the modification times order the entries by last use,
+# and adding one evicts the least recently used until the folder is under max_bytes.
+# Every tour stored is also offered as the instance's best known tour (best), for warm starts
+# and upper bounds. Writes go through a temporary file so several processes can share a folder
+class SolutionCache:
+    def __init__(self, folder=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, digest, solver, params):
+        text = json.dumps({"instance": digest, "solver": solver, "params": params or {}, "version": CACHE_VERSION},
+                          sort_keys=True, default=str)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def path(self, name):
+        return os.path.join(self.folder, name + ".json")
+
+    # Function to read an entry and mark it as just used, None when there is none
+    def read(self, name):
+        path = self.path(name)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def write(self, name, entry):
+        path = self.path(name)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(entry, file)
+            os.replace(temp_path, path)
+        except OSError:
+            pass # a read-only or full disk just means nothing is cached
+
+    # Function to get the cached (route, cost) of a solver run with these params, None on a miss
+    def get(self, digest, solver, params=None):
+        entry = self.read(self.key(digest, solver, params))
+        return None if entry is None else (entry["route"], entry["cost"])
+
+    # Function to get the best tour stored for an instance by any solver as (route, cost), None if there is none
+    def best(self, digest):
+        entry = self.read("best-" + digest)
+        return None if entry is None else (entry["route"], entry["cost"])
+
+    # Function to store a solver's tour (city indices, start not repeated) and its cost
+    def put(self, digest, solver, params, route, cost):
+        entry = {"instance": digest, "solver": solver, "params": params or {}, "cost": cost,
+                 "route": [int(city) for city in route], "saved": time.time()}
+        self.write(self.key(digest, solver, params), entry)
+        best = self.best(digest)
+        if best is None or cost < best[1]:
+            self.write("best-" + digest, entry)
+        self.evict()
+
+    # Function to remove the least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        with os.scandir(self.folder) as found:
+            for item in found:
+                if item.name.endswith(".json"):
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue # removed by another process meanwhile
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.folder):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.folder, name))
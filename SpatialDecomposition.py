@@ -0,0 +1,184 @@
+import numpy as np
+import matplotlib.pyplot as plt
+import os
+import time
+import multiprocessing
+import DistanceMatrix
+import SpatialIndex
+import TSPParser
+import NearestNeighbour
+import hillclimbing
+import LinKernighan
+import Instrument
+
+CLUSTER_SIZE = 1000 # bisection stops once a cluster has at most this many cities
+CANDIDATES = 8 # nearest neighbours used to join the clusters and by the boundary local search
+METHOD = "lk" # heuristic run on each cluster, "lk" (iterated Lin-Kernighan) or "local_search" (2-opt and or-opt)
+CLUSTER_TIME = 1.0 # seconds of iterated LK spent on each cluster
+
+# Function to load a TSPLIB file without building any distance matrix, the distances
+# come from the coordinates (DistanceMatrix.CoordinateDistances)
+def load_tsp_file(filename):
+    problem = TSPParser.parse_tsp_file(filename)
+    cities = list(problem.get_nodes())
+    return cities, DistanceMatrix.CoordinateDistances(problem, cities), problem
+
+# Function to split the cities into clusters of at most size cities, Karp style: cut at the
+# median of the longer side of the bounding box and repeat on both halves
+def bisect(coords, size=CLUSTER_SIZE):
+    clusters = []
+    stack = [np.arange(len(coords))]
+    while stack:
+        members = stack.pop()
+        if len(members) <= size:
+            clusters.append(members)
+            continue
+        points = coords[members]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        order = np.argsort(points[:, axis], kind="stable")
+        half = len(members) // 2
+        stack.append(members[order[half:]])
+        stack.append(members[order[:half]])
+    return clusters
+
+# Worker: solve one cluster on its own small distance matrix, returns the tour as cluster positions
+def solve_cluster(task):
+    coords, edge_weight_type, method, time_limit = task
+    m = len(coords)
+    graph = DistanceMatrix.coordinate_matrix(coords, DistanceMatrix.DISTANCE_FUNCTIONS[edge_weight_type])
+    cities = list(range(m))
+    if m < 4:
+        return cities
+    candidates = SpatialIndex.matrix_candidate_lists(graph, CANDIDATES)
+    route = NearestNeighbour.tsp_nearest_neighbour(graph, cities)[0][:m]
+    if method == "lk":
+        return LinKernighan.lin_kernighan(cities, graph, route, candidates, time_limit=time_limit)[0]
+    return hillclimbing.local_search(route, graph, candidates)[0]
+
+# Function to solve every cluster, on a process pool unless there is only one worker
+def solve_clusters(graph, edge_weight_type, clusters, method, time_limit, workers):
+    tasks = [(graph.coords[members], edge_weight_type, method, time_limit) for members in clusters]
+    if workers == 1:
+        routes = map(solve_cluster, tasks)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            routes = pool.map(solve_cluster, tasks)
+    return [members[route] for members, route in zip(clusters, routes)]
+
+# Function to order the clusters by a tour through their centres, so each one joins the tour next to the last
+def cluster_order(planar, clusters):
+    centres = np.array([planar[members].mean(axis=0) for members in clusters])
+    if len(centres) < 4:
+        return list(range(len(centres)))
+    dist = np.rint(np.sqrt(((centres[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2))).astype(np.int64)
+    route = NearestNeighbour.tsp_nearest_neighbour(dist, centres)[0][:len(centres)]
+    return hillclimbing.local_search(route, dist)[0]
+
+# Function to find the cheapest way of joining a cluster tour into the tour built so far:
+# remove the tour edge (a, b) and the cluster edge (x, y), add (a, x) and (b, y).
+# The pairs tried are a cluster city x and a candidate neighbour a of it already in the tour
+def best_join(graph, route, pos, sub, planar, candidates, joined):
+    members = np.asarray(sub)
+    x = np.repeat(members, candidates.shape[1])
+    a = candidates[members].ravel()
+    keep = joined[a]
+    x, a = x[keep], a[keep]
+    if len(a) == 0:
+        # no candidate reaches the tour, join through the tour city nearest the cluster's centre
+        inside = np.flatnonzero(joined)
+        a = inside[[np.argmin(((planar[inside] - planar[members].mean(axis=0)) ** 2).sum(axis=1))]]
+        x = members[[np.argmin(((planar[members] - planar[a[0]]) ** 2).sum(axis=1))]]
+
+    # each pair can cut either tour edge at a and either cluster edge at x
+    sub_pos = {city: i for i, city in enumerate(sub)}
+    at = np.array([sub_pos[city] for city in x.tolist()])
+    m, n = len(sub), len(route)
+    a = np.repeat(a, 4)
+    x = np.repeat(x, 4)
+    b = route[(pos[a] + np.tile([1, -1, 1, -1], len(at))) % n]
+    y = sub[(np.repeat(at, 4) + np.tile([1, 1, -1, -1], len(at))) % m]
+    delta = graph[a, x].astype(np.int64) + graph[b, y] - graph[a, b] - graph[x, y]
+    best = int(np.argmin(delta))
+    return int(a[best]), int(b[best]), int(x[best]), int(y[best])
+
+# Function to splice the cluster tour sub into the route between the adjacent cities a and b,
+# as a path that starts at x next to a and ends at y next to b
+def splice(route, pos, sub, a, b, x, y):
+    sub = np.roll(sub, -int(np.flatnonzero(sub == x)[0]))
+    if len(sub) > 1 and sub[1] == y:
+        sub = np.concatenate([sub[:1], sub[1:][::-1]]) # go round the other way so the path ends at y
+    i = int(pos[a])
+    if route[(i + 1) % len(route)] == b:
+        return np.concatenate([route[:i + 1], sub, route[i + 1:]])
+    return np.concatenate([route[:i], sub[::-1], route[i:]])
+
+# Partition-and-stitch solver for instances too big for a distance matrix: bisect the cities into
+# clusters, solve the clusters in parallel, join the cluster tours one at a time in the order of a
+# tour through their centres, then run local search starting from the cities near cluster borders.
+# Memory stays linear in the number of cities apart from the clusters' own small matrices
+def spatial_decomposition(problem, cities, graph=None, cluster_size=CLUSTER_SIZE, method=METHOD,
+                          cluster_time=CLUSTER_TIME, workers=None, boundary_search=True):
+    begin_time = time.time()
+    distances = DistanceMatrix.CoordinateDistances(problem, cities) # the clusters build their matrices from its coordinates
+    if graph is None:
+        graph = distances
+    n = len(cities)
+    with Instrument.phase("candidates"):
+        planar = SpatialIndex.planar_coordinates(problem, cities)
+        candidates = SpatialIndex.GridIndex(planar).candidate_lists(CANDIDATES)
+
+    #Step 1: Split the cities and solve each cluster
+    with Instrument.phase("clusters"):
+        clusters = bisect(planar, cluster_size)
+        tours = solve_clusters(distances, problem.edge_weight_type, clusters, method, cluster_time, workers or os.cpu_count())
+
+    #Step 2: Join the cluster tours into one tour
+    with Instrument.phase("join"):
+        order = cluster_order(planar, clusters)
+        route = tours[order[0]]
+        joined = np.zeros(n, dtype=bool)
+        joined[route] = True
+        pos = np.empty(n, dtype=np.int64)
+        for k in order[1:]:
+            pos[route] = np.arange(len(route))
+            a, b, x, y = best_join(graph, route, pos, tours[k], planar, candidates, joined)
+            route = splice(route, pos, tours[k], a, b, x, y)
+            joined[tours[k]] = True
+
+    #Step 3: Repair the seams, only cities with a candidate in another cluster start in the queue
+    route = route.tolist()
+    if boundary_search and len(clusters) > 1:
+        cluster_of = np.empty(n, dtype=np.int64)
+        for k, members in enumerate(clusters):
+            cluster_of[members] = k
+        boundary = np.flatnonzero((cluster_of[candidates] != cluster_of[:, None]).any(axis=1))
+        trace = Instrument.active()
+        if trace is not None:
+            trace.add({"clusters": len(clusters), "boundary_cities": len(boundary)}, "decomposition.")
+        route, cost = hillclimbing.local_search(route, graph, candidates, queue=boundary)
+    else:
+        cost = DistanceMatrix.route_cost(route, graph)
+    end_time = time.time()
+    return route, cost, begin_time, end_time
+
+# Function to plot the route using matplotlib, without markers since the instances are big
+def plot_route(cities, route, problem):
+    coords = DistanceMatrix.node_coordinates(problem, cities)[route + route[:1]]
+    plt.plot(coords[:, 0], coords[:, 1], 'r-', linewidth=0.3, label="Route")
+    plt.title("Spatial Decomposition Visualisation")
+    plt.xlabel("X-coordinate")
+    plt.ylabel("Y-coordinate")
+    plt.grid(False)
+    plt.legend()
+    plt.show()
+
+# Main Code
+if __name__ == "__main__":
+    filename = "./tsplib-master/pla85900.tsp"  # Replace with your TSP file path
+    cities, graph, problem = load_tsp_file(filename)
+    best_route, best_distance, begin_time, end_time = spatial_decomposition(problem, cities, graph)
+    print("Number of cities:", len(best_route))
+    print("Total Cost: ", best_distance)
+    print("Parse Time: ", problem.parse_time)
+    print("Execution Time: ", ((end_time - begin_time)))
+    plot_route(cities, best_route, problem)
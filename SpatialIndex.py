@@ -0,0 +1,187 @@
+import numpy as np
+import DistanceMatrix
+
+POINTS_PER_CELL = 2 # average number of cities in a grid cell
+CANDIDATES = 10 # default length of the candidate lists
+
+# Uniform grid over the city coordinates. Cities are stored sorted by cell (like a CSR
+# matrix) so a cell is one slice of self.order, and removing a city swaps it to the
+# end of its cell's slice. That gives O(1) deletion and "nearest remaining city"
+# queries that only look at the rings of cells around the query point.
+class GridIndex:
+    def __init__(self, coords, points_per_cell=POINTS_PER_CELL):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64)
+        n = len(self.coords)
+        self.low = self.coords.min(axis=0)
+        span = self.coords.max(axis=0) - self.low
+        span = np.maximum(span, span.max() / max(n, 1) + 1e-9) # cities on a line still get a 2D grid
+        self.cell_size = float(np.sqrt(span[0] * span[1] * points_per_cell / max(n, 1)))
+        self.nx, self.ny = (span // self.cell_size).astype(np.int64) + 1
+
+        cell_x, cell_y = self.cell_coords(self.coords)
+        self.cell_of = cell_x * self.ny + cell_y
+        self.order = np.argsort(self.cell_of, kind="stable")
+        self.start = np.searchsorted(self.cell_of[self.order], np.arange(self.nx * self.ny + 1))
+        self.size = np.diff(self.start) # cities per cell when the grid was built
+        self.count = self.size.copy() # cities per cell still in the grid
+        self.position = np.empty(n, dtype=np.int64)
+        self.position[self.order] = np.arange(n)
+        self.alive = np.ones(n, dtype=bool)
+        self.alive_count = n
+
+    def __len__(self):
+        return self.alive_count
+
+    # Function to get the grid cell (x, y) of one or more points
+    def cell_coords(self, points):
+        cells = ((np.asarray(points, dtype=np.float64) - self.low) // self.cell_size).astype(np.int64)
+        cell_x = np.clip(cells[..., 0], 0, self.nx - 1)
+        cell_y = np.clip(cells[..., 1], 0, self.ny - 1)
+        return cell_x, cell_y
+
+    # Function to remove a city from the grid in O(1)
+    def remove(self, city):
+        if not self.alive[city]:
+            return
+        cell = self.cell_of[city]
+        last = self.start[cell] + self.count[cell] - 1
+        pos = self.position[city]
+        other = self.order[last]
+        self.order[pos], self.order[last] = other, city
+        self.position[other], self.position[city] = pos, last
+        self.count[cell] -= 1
+        self.alive[city] = False
+        self.alive_count -= 1
+
+    # Function to get the cities in a list of cells, alive ones only or everything the cell started with
+    def cells_points(self, cells, alive_only=True):
+        counts = self.count[cells] if alive_only else self.size[cells]
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        starts = self.start[cells]
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        return self.order[offsets]
+
+    # Function to get the cell ids in the square of cells within r of (cell_x, cell_y)
+    def window_cells(self, cell_x, cell_y, r):
+        xs = np.arange(max(cell_x - r, 0), min(cell_x + r, self.nx - 1) + 1)
+        ys = np.arange(max(cell_y - r, 0), min(cell_y + r, self.ny - 1) + 1)
+        return (xs[:, None] * self.ny + ys[None, :]).ravel()
+
+    # Function to get the cell ids on the ring exactly r cells away from (cell_x, cell_y)
+    def ring_cells(self, cell_x, cell_y, r):
+        if r == 0:
+            return np.array([cell_x * self.ny + cell_y])
+        side = np.arange(-r, r + 1)
+        xs = np.concatenate([side, side, np.full(2 * r - 1, -r), np.full(2 * r - 1, r)]) + cell_x
+        ys = np.concatenate([np.full(2 * r + 1, -r), np.full(2 * r + 1, r), side[1:-1], side[1:-1]]) + cell_y
+        inside = (xs >= 0) & (xs < self.nx) & (ys >= 0) & (ys < self.ny)
+        return xs[inside] * self.ny + ys[inside]
+
+    # Function to find the closest city still in the grid to a point, -1 if the grid is empty
+    def nearest(self, point):
+        if self.alive_count == 0:
+            return -1
+        point = np.asarray(point, dtype=np.float64)
+        cell_x, cell_y = self.cell_coords(point)
+        best, best_dist = -1, np.inf
+        r = 0
+        while True:
+            if (2 * r + 1) ** 2 > 4 * self.alive_count:
+                # the rings are mostly empty now, checking every remaining city is cheaper
+                return self.brute_nearest(point)
+            found = self.cells_points(self.ring_cells(cell_x, cell_y, r))
+            if len(found):
+                dist = ((self.coords[found] - point) ** 2).sum(axis=1)
+                k = int(np.argmin(dist))
+                if dist[k] < best_dist:
+                    best, best_dist = int(found[k]), dist[k]
+            # anything outside the rings searched so far is at least r cells away
+            if best >= 0 and best_dist <= (r * self.cell_size) ** 2:
+                return best
+            r += 1
+
+    # Function to check every remaining city, used once the grid is nearly empty
+    def brute_nearest(self, point):
+        remaining = np.flatnonzero(self.alive)
+        dist = ((self.coords[remaining] - point) ** 2).sum(axis=1)
+        return int(remaining[np.argmin(dist)])
+
+    # Function to pop the closest remaining city to a point
+    def pop_nearest(self, point):
+        city = self.nearest(point)
+        if city >= 0:
+            self.remove(city)
+        return city
+
+    # Function to build the k nearest neighbours of every city, one grid cell at a time
+    def candidate_lists(self, k=CANDIDATES):
+        n = len(self.coords)
+        k = min(k, n - 1)
+        candidates = np.empty((n, k), dtype=np.int32)
+        if k <= 0:
+            return candidates
+        for cell in np.flatnonzero(self.size):
+            cell_x, cell_y = divmod(int(cell), int(self.ny))
+            points = self.cells_points(np.array([cell]), alive_only=False)
+            r = 1
+            while True:
+                near = self.cells_points(self.window_cells(cell_x, cell_y, r), alive_only=False)
+                dist = ((self.coords[points, None, :] - self.coords[None, near, :]) ** 2).sum(axis=2)
+                dist[points[:, None] == near[None, :]] = np.inf # a city is not its own neighbour
+                if len(near) > k:
+                    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                    kth = np.take_along_axis(dist, nearest, axis=1).max(axis=1)
+                    # the window is only trusted if nothing outside it could be closer
+                    if np.all(kth <= (r * self.cell_size) ** 2) or len(near) == n:
+                        break
+                elif len(near) == n:
+                    nearest = np.argsort(dist, axis=1)[:, :k]
+                    break
+                r += 1
+            order = np.argsort(np.take_along_axis(dist, nearest, axis=1), axis=1, kind="stable")
+            candidates[points] = near[np.take_along_axis(nearest, order, axis=1)]
+        return candidates
+
+# Function to get coordinates that plane geometry works on, None for instances without any
+# GEO latitude/longitude is flattened with an equirectangular projection
+def planar_coordinates(problem, cities):
+    if problem.edge_weight_type == "EXPLICIT":
+        return None
+    coords = DistanceMatrix.node_coordinates(problem, cities)
+    return None if coords is None else planar_points(coords, problem.edge_weight_type)
+
+# Function to flatten TSPLIB coordinates of the given edge weight type, GEO gets the projection
+def planar_points(coords, edge_weight_type):
+    if edge_weight_type != "GEO":
+        return coords
+    lat, lng = DistanceMatrix.geo_radians(np.asarray(coords, dtype=np.float64)).T
+    return np.column_stack([DistanceMatrix.EARTH_RADIUS * lat, DistanceMatrix.EARTH_RADIUS * lng * np.cos(lat)])
+
+# Function to build a grid index for a problem, None when it has no coordinates
+def build_index(problem, cities, points_per_cell=POINTS_PER_CELL):
+    coords = planar_coordinates(problem, cities)
+    return None if coords is None else GridIndex(coords, points_per_cell)
+
+# Function to build the k nearest neighbour lists of every city as an (n, k) array of indices
+# Coordinate instances use the grid, explicit ones fall back to the distance matrix rows
+def candidate_lists(problem, cities, dist=None, k=CANDIDATES):
+    index = build_index(problem, cities)
+    if index is not None:
+        return index.candidate_lists(k)
+    if dist is None:
+        dist = DistanceMatrix.distance_matrix(problem, cities)
+    return matrix_candidate_lists(dist, k)
+
+# Function to get the k nearest neighbours of every city straight from a distance matrix
+def matrix_candidate_lists(dist, k=CANDIDATES):
+    n = len(dist)
+    k = min(k, n - 1)
+    candidates = np.empty((n, k), dtype=np.int32)
+    for i in range(n):
+        row = np.array(dist[i], dtype=np.float64)
+        row[i] = np.inf
+        nearest = np.argpartition(row, k - 1)[:k] if k > 0 else np.empty(0, dtype=np.int64)
+        candidates[i] = nearest[np.argsort(row[nearest], kind="stable")]
+    return candidates
@@ -0,0 +1,207 @@
+import hashlib
+import itertools
+import json
+import os
+import time
+import numpy as np
+
+CHUNK_LINES = 65536 # lines converted to numbers in one bulk call
+CACHE_DIR = ".tsp_cache" # sidecar cache folder created next to the .tsp file
+CACHE_VERSION = 1 # bump when the cached layout changes so old sidecars are ignored
+
+# Parsed TSPLIB instance, everything big is kept as a numpy array
+class TSPInstance:
+    def __init__(self, header, coords=None, edge_weights=None, display=None):
+        self.header = header
+        self.name = header.get("NAME")
+        self.type = header.get("TYPE")
+        self.comment = header.get("COMMENT")
+        self.dimension = int(header["DIMENSION"]) if "DIMENSION" in header else None
+        self.edge_weight_type = header.get("EDGE_WEIGHT_TYPE")
+        self.edge_weight_format = header.get("EDGE_WEIGHT_FORMAT")
+        self.coord_labels, self.coords = split_labels(coords)
+        self.display_labels, self.display = split_labels(display)
+        self.edge_weights = None if edge_weights is None else np.ravel(edge_weights) # weights wrap lines freely
+        self.parse_time = 0.0
+        self.from_cache = False
+        self._node_coords = None
+
+        # same node numbering tsplib95 uses: coordinates, then display data, then 0..n-1
+        if self.coords is not None:
+            self.cities = self.coord_labels
+        elif self.display is not None:
+            self.cities = self.display_labels
+        else:
+            self.cities = np.arange(self.dimension)
+
+    def get_nodes(self):
+        return iter(self.cities.tolist())
+
+    # dict of label -> (x, y), only built when something like plot_route asks for it
+    @property
+    def node_coords(self):
+        if self._node_coords is None:
+            if self.coords is None:
+                self._node_coords = {}
+            else:
+                self._node_coords = dict(zip(self.coord_labels.tolist(), map(tuple, self.coords.tolist())))
+        return self._node_coords
+
+# Function to split "label x y" rows into sorted labels and coordinates
+def split_labels(rows):
+    if rows is None:
+        return None, None
+    labels = rows[:, 0].astype(np.int64)
+    coords = rows[:, 1:]
+    if np.any(labels[1:] < labels[:-1]):
+        order = np.argsort(labels, kind="stable")
+        labels, coords = labels[order], coords[order]
+    return labels, np.ascontiguousarray(coords)
+
+# Function to load a TSPLIB file, using the binary sidecar cache when the file has not changed
+def parse_tsp_file(filename, use_cache=True):
+    begin_time = time.time() #start the timer
+    path = cache_path(filename, file_digest(filename))
+    instance = load_cache(path) if use_cache else None
+
+    if instance is None:
+        header, sections = parse_stream(filename)
+        instance = TSPInstance(header, sections.get("NODE_COORD_SECTION"), sections.get("EDGE_WEIGHT_SECTION"), sections.get("DISPLAY_DATA_SECTION"))
+        if use_cache:
+            save_cache(instance, path)
+
+    instance.parse_time = time.time() - begin_time #end the timer
+    return instance
+
+# Function to read the header and sections of a file in one pass
+def parse_stream(filename):
+    header = {}
+    sections = {}
+    with open(filename) as f:
+        lines = iter(f)
+        line = next(lines, None)
+        while line is not None:
+            text = line.strip()
+            keyword = text.rstrip(": ")
+            if not text:
+                line = next(lines, None)
+            elif keyword == "EOF":
+                break
+            elif keyword.endswith("SECTION"):
+                sections[keyword], line, lines = read_section(lines)
+            elif ":" in text:
+                key, value = text.split(":", 1)
+                header[key.strip()] = value.strip()
+                line = next(lines, None)
+            else:
+                raise ValueError(f"Unexpected line in {filename}: {text}")
+    return header, sections
+
+# Function to stream one section into a numpy array, CHUNK_LINES lines at a time
+# Returns the values, the line that ended the section and the remaining lines
+def read_section(lines):
+    chunks = []
+    width = None
+    while True:
+        chunk = list(itertools.islice(lines, CHUNK_LINES))
+        if not chunk:
+            return section_array(chunks, width), None, lines
+        if width is None:
+            width = next((len(l.split()) for l in chunk if l.strip()), None)
+
+        try:
+            chunks.append(np.array(" ".join(chunk).split(), dtype=np.float64))
+            continue
+        except ValueError:
+            pass
+
+        # a keyword (next section or EOF) is somewhere in this chunk
+        end = next(k for k, l in enumerate(chunk) if l.strip()[:1].isalpha())
+        chunks.append(np.array(" ".join(chunk[:end]).split(), dtype=np.float64))
+        rest = itertools.chain(chunk[end + 1:], lines)
+        return section_array(chunks, width), chunk[end], rest
+
+# Function to join the parsed chunks, coordinate style sections become one row per node
+def section_array(chunks, width):
+    values = np.concatenate(chunks) if chunks else np.empty(0)
+    if width is None or width == 1 or len(values) % width:
+        return values
+    return values.reshape(-1, width)
+
+# Function to hash the raw bytes of a file so the cache notices any edit
+def file_digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to get the sidecar cache path for a file with a given hash
+def cache_path(filename, digest):
+    folder = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR)
+    name = os.path.basename(filename)
+    return os.path.join(folder, f"{name}.{digest[:16]}.v{CACHE_VERSION}.npz")
+
+# Function to read a cached instance, returns None if there is no usable cache
+def load_cache(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data["header"]))
+            arrays = {key: data[key] for key in data.files if key != "header"}
+    except (OSError, ValueError, KeyError):
+        return None
+    coords = rejoin_labels(arrays, "coords")
+    display = rejoin_labels(arrays, "display")
+    instance = TSPInstance(header, coords, arrays.get("edge_weights"), display)
+    instance.from_cache = True
+    return instance
+
+# Function to put the labels back in front of the coordinates stored in the cache
+def rejoin_labels(arrays, key):
+    if key not in arrays:
+        return None
+    return np.column_stack([arrays[key + "_labels"], arrays[key]]) if key + "_labels" in arrays else arrays[key]
+
+# Function to write the cache, written to a temporary file first so readers never see half a file
+def save_cache(instance, path):
+    arrays = {"header": np.array(json.dumps(instance.header))}
+    if instance.coords is not None:
+        arrays["coords"] = instance.coords
+        arrays["coords_labels"] = instance.coord_labels
+    if instance.display is not None:
+        arrays["display"] = instance.display
+        arrays["display_labels"] = instance.display_labels
+    if instance.edge_weights is not None:
+        arrays["edge_weights"] = instance.edge_weights
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, path)
+    except OSError:
+        pass # a read-only data folder just means no cache
+
+# Function to write a route (indices into cities) as a TSPLIB .tour file with the cities' labels
+def write_tour_file(filename, name, route, cities, comment=None):
+    labels = np.asarray(cities)[np.asarray(route, dtype=np.int64)]
+    lines = [f"NAME : {name}", "TYPE : TOUR"]
+    if comment:
+        lines.append(f"COMMENT : {comment}")
+    lines += [f"DIMENSION : {len(labels)}", "TOUR_SECTION"]
+    lines += [str(label) for label in labels.tolist()]
+    lines += ["-1", "EOF", ""]
+    temp_path = f"{filename}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write("\n".join(lines))
+    os.replace(temp_path, filename)
+
+# Function to read a TSPLIB .tour file, returns the header and the tour as city labels
+def read_tour_file(filename):
+    header, sections = parse_stream(filename)
+    tour = np.ravel(sections.get("TOUR_SECTION", np.empty(0))).astype(np.int64)
+    end = np.flatnonzero(tour < 0)
+    return header, tour[:end[0]] if len(end) else tour
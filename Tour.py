@@ -0,0 +1,279 @@
+import numpy as np
+import DistanceMatrix
+
+TWO_LEVEL_MIN = 10000 # tours at least this long use the two-level list, it is no slower there and pulls ahead as n grows
+GROUP_SLACK = 2 # a two-level tour is regrouped once it has this many times the target number of segments
+
+# Function to reverse the tour between positions i and j (inclusive, wrapping round),
+# the other side is reversed instead when it is shorter, which gives the same tour
+def reverse_segment(order, pos, i, j):
+    n = len(order)
+    length = (j - i) % n + 1
+    if 2 * length > n:
+        i, j = (j + 1) % n, (i - 1) % n
+        length = n - length
+    index = (i + np.arange(length)) % n
+    order[index] = order[index[::-1]]
+    pos[order[index]] = index
+
+# A tour held as int32 arrays: order[k] is the k-th city and pos[c] is where city c is.
+# next/prev/between are O(1) and reversing a path costs the length of its shorter side.
+# Moves are made with two_opt_move, which only needs the four cities and works whichever way
+# round the tour currently runs. When journal is a list every move is logged so undo can roll back.
+class Tour:
+    def __init__(self, route):
+        self.order = np.array(route, dtype=np.int32)
+        self.n = len(self.order)
+        self.pos = np.empty(self.n, dtype=np.int32)
+        self.pos[self.order] = np.arange(self.n, dtype=np.int32)
+        self.journal = None
+
+    def __len__(self):
+        return self.n
+
+    def next(self, c):
+        return int(self.order[(self.pos[c] + 1) % self.n])
+
+    def prev(self, c):
+        return int(self.order[(self.pos[c] - 1) % self.n])
+
+    # Function to check whether b is on the path going forward from a to c (ends included)
+    def between(self, a, b, c):
+        pa, pb, pc = self.pos[a], self.pos[b], self.pos[c]
+        if pa <= pc:
+            return pa <= pb <= pc
+        return pb >= pa or pb <= pc
+
+    # Function to reverse the path going forward from city a to city b
+    def reverse(self, a, b):
+        reverse_segment(self.order, self.pos, int(self.pos[a]), int(self.pos[b]))
+
+    # Function to swap the tour edges (t1, t2) and (t3, t4) for (t2, t3) and (t4, t1).
+    # t2 must be next to t1 and t4 next to t3 on the opposite side (t2 = next(t1), t4 = prev(t3) or the mirror)
+    def two_opt_move(self, t1, t2, t3, t4):
+        if self.next(t1) == t2:
+            self.reverse(t2, t4)
+        else:
+            self.reverse(t4, t2)
+        if self.journal is not None:
+            self.journal.append((t1, t2, t3, t4))
+
+    # Function to roll the journal back to an earlier length, undoing the moves made since
+    def undo(self, mark=0):
+        journal, self.journal = self.journal, None
+        while len(journal) > mark:
+            t1, t2, t3, t4 = journal.pop()
+            self.two_opt_move(t1, t4, t3, t2)
+        self.journal = journal
+
+    # Function to put a new city c (numbered len(tour)) into the tour right after city a
+    def insert(self, c, a):
+        self.order = np.insert(self.order, int(self.pos[a]) + 1, c)
+        self.n += 1
+        self.pos = np.empty(self.n, dtype=np.int32)
+        self.pos[self.order] = np.arange(self.n, dtype=np.int32)
+
+    # Function to take city c out of the tour. The last city (numbered len(tour) - 1) is renumbered
+    # to c so the cities stay 0..n-1, callers renumber their own data the same way
+    def remove(self, c):
+        k = int(self.pos[c])
+        self.order = np.delete(self.order, k)
+        self.n -= 1
+        if c != self.n:
+            self.order[self.pos[self.n] - (self.pos[self.n] > k)] = c
+        self.pos = np.empty(self.n, dtype=np.int32)
+        self.pos[self.order] = np.arange(self.n, dtype=np.int32)
+
+    # Function to take city c out of where it is and put it back right after city a
+    def relocate(self, c, a):
+        order = np.delete(self.order, int(self.pos[c]))
+        self.order = np.insert(order, int(np.flatnonzero(order == a)[0]) + 1, c)
+        self.pos[self.order] = np.arange(self.n, dtype=np.int32)
+
+    # Function to get the tour as a list of cities starting from the city at position 0
+    def to_list(self):
+        return self.order.tolist()
+
+    def cost(self, graph):
+        return DistanceMatrix.route_cost(self.to_list(), graph)
+
+# One segment of a two-level tour, its cities are stored in order and read backwards when reversed
+class Segment:
+    __slots__ = ("cities", "reversed", "rank", "offset")
+
+    def __init__(self, cities):
+        self.cities = cities
+        self.reversed = False
+        self.rank = 0 # where the segment is in the tour
+        self.offset = 0 # number of cities in the segments before it
+
+# Two-level list: the tour is a sequence of about sqrt(n) segments that each carry a reversed flag.
+# Reversing a path splits at most two segments and then reverses the run of whole segments between
+# them by flipping their flags, O(sqrt(n)) instead of O(n). Cities are inserted, removed and
+# relocated inside their segment, so the whole interface of Tour is O(sqrt(n)) per call here.
+class TwoLevelTour(Tour):
+    def __init__(self, route, group=None):
+        route = [int(c) for c in route]
+        self.n = len(route)
+        self.group = group or max(8, int(np.sqrt(self.n)))
+        self.segment_of = [None] * self.n
+        self.index = [0] * self.n # where each city is in its segment's list
+        self.journal = None
+        self.regroup(route)
+
+    # Function to cut the route into segments of self.group cities
+    def regroup(self, route):
+        self.segments = [Segment(route[k:k + self.group]) for k in range(0, self.n, self.group)]
+        for segment in self.segments:
+            for i, c in enumerate(segment.cities):
+                self.segment_of[c] = segment
+                self.index[c] = i
+        self.renumber()
+
+    def renumber(self):
+        offset = 0
+        for rank, segment in enumerate(self.segments):
+            segment.rank = rank
+            segment.offset = offset
+            offset += len(segment.cities)
+
+    # Function to get where a city is along its segment in tour direction
+    def local(self, c):
+        segment = self.segment_of[c]
+        i = self.index[c]
+        return len(segment.cities) - 1 - i if segment.reversed else i
+
+    def position(self, c):
+        return self.segment_of[c].offset + self.local(c)
+
+    def first(self, segment):
+        return segment.cities[-1] if segment.reversed else segment.cities[0]
+
+    def last(self, segment):
+        return segment.cities[0] if segment.reversed else segment.cities[-1]
+
+    def next(self, c):
+        segment = self.segment_of[c]
+        i = self.index[c] + (-1 if segment.reversed else 1)
+        if 0 <= i < len(segment.cities):
+            return segment.cities[i]
+        return self.first(self.segments[(segment.rank + 1) % len(self.segments)])
+
+    def prev(self, c):
+        segment = self.segment_of[c]
+        i = self.index[c] + (1 if segment.reversed else -1)
+        if 0 <= i < len(segment.cities):
+            return segment.cities[i]
+        return self.last(self.segments[segment.rank - 1])
+
+    def between(self, a, b, c):
+        pa, pb, pc = self.position(a), self.position(b), self.position(c)
+        if pa <= pc:
+            return pa <= pb <= pc
+        return pb >= pa or pb <= pc
+
+    # Function to split a segment so its first k cities (in tour direction) are a segment of their own
+    def split(self, segment, k):
+        if k <= 0 or k >= len(segment.cities):
+            return
+        if segment.reversed:
+            segment.cities.reverse()
+            segment.reversed = False
+            for i, c in enumerate(segment.cities):
+                self.index[c] = i
+        tail = Segment(segment.cities[k:])
+        segment.cities = segment.cities[:k]
+        for i, c in enumerate(tail.cities):
+            self.segment_of[c] = tail
+            self.index[c] = i
+        self.segments.insert(segment.rank + 1, tail)
+        self.renumber()
+
+    def reverse(self, a, b):
+        length = (self.position(b) - self.position(a)) % self.n + 1
+        if 2 * length > self.n:
+            a, b = self.next(b), self.prev(a)
+            length = self.n - length
+        if length < 2:
+            return
+
+        # make a start a segment and b end one, then the path is a run of whole segments
+        self.split(self.segment_of[a], self.local(a))
+        self.split(self.segment_of[b], self.local(b) + 1)
+        start, stop = self.segment_of[a].rank, self.segment_of[b].rank
+        if start > stop:
+            self.segments = self.segments[start:] + self.segments[:start]
+            stop -= start - len(self.segments)
+            start = 0
+        run = self.segments[start:stop + 1]
+        for segment in run:
+            segment.reversed = not segment.reversed
+        self.segments[start:stop + 1] = run[::-1]
+
+        if len(self.segments) > GROUP_SLACK * (self.n // self.group + 1):
+            self.regroup(self.to_list())
+        else:
+            self.renumber()
+
+    # Function to put city c into the segment of city a, right after a in tour direction
+    def place(self, c, a):
+        segment = self.segment_of[a]
+        i = self.index[a] + (0 if segment.reversed else 1)
+        segment.cities.insert(i, c)
+        for k in range(i, len(segment.cities)):
+            self.index[segment.cities[k]] = k
+        self.segment_of[c] = segment
+
+    # Function to take city c out of its segment, a segment left empty is dropped
+    def unplace(self, c):
+        segment = self.segment_of[c]
+        i = self.index[c]
+        del segment.cities[i]
+        for k in range(i, len(segment.cities)):
+            self.index[segment.cities[k]] = k
+        if not segment.cities:
+            self.segments.pop(segment.rank)
+
+    # Function to renumber the segments after a city was placed, a segment grown too long is split in two
+    def settle(self, segment):
+        if len(segment.cities) > GROUP_SLACK * self.group:
+            self.split(segment, len(segment.cities) // 2)
+        else:
+            self.renumber()
+
+    def insert(self, c, a):
+        self.segment_of.append(None)
+        self.index.append(0)
+        self.n += 1
+        self.place(c, a)
+        self.settle(self.segment_of[c])
+
+    def remove(self, c):
+        self.unplace(c)
+        self.n -= 1
+        if c != self.n:
+            segment = self.segment_of[self.n]
+            segment.cities[self.index[self.n]] = c
+            self.segment_of[c] = segment
+            self.index[c] = self.index[self.n]
+        self.segment_of.pop()
+        self.index.pop()
+        self.renumber()
+
+    def relocate(self, c, a):
+        self.unplace(c)
+        self.renumber()
+        self.place(c, a)
+        self.settle(self.segment_of[c])
+
+    def to_list(self):
+        route = []
+        for segment in self.segments:
+            route += segment.cities[::-1] if segment.reversed else segment.cities
+        return route
+
+# Function to make the tour representation that suits the route's length
+def make_tour(route, two_level=None):
+    if two_level is None:
+        two_level = len(route) >= TWO_LEVEL_MIN
+    return TwoLevelTour(route) if two_level else Tour(route)
@@ -1,9 +1,13 @@
 import numpy as np
 import random
-import tsplib95
-import itertools
 import matplotlib.pyplot as plt
 import time
+from collections import deque
+import DistanceMatrix
+import SpatialIndex
+import Tour
+import Anytime
+import Instrument
 
 
 
@@ -14,63 +18,186 @@ random.seed(42)
 
 # Function to load a TSPLIB file and extract cities and distances
 def load_tsp_file(filename):
-    problem = tsplib95.load(filename)
-    cities = list(problem.get_nodes())
-    graph = {i: {j: problem.get_weight(i, j) for j in cities} for i in cities}
-    G = problem.get_graph()
+    problem, cities, graph = DistanceMatrix.load_tsp_file(filename)
     return cities, graph, problem
 
-def calculate_cost(route, graph): 
-    total_cost = 0
-    n = len(route)
-    for i in range(n):
-        current_city = route[i]
-        next_city = route[(i + 1) % n]  # Wrap around to the start of the route
-        total_cost += graph[current_city][next_city]
-    return total_cost
+def calculate_cost(route, graph):
+    return DistanceMatrix.route_cost(route, graph) # wraps around to the start of the route
 
 
 # Function to create a random initial route
 def create_initial_route(cities):
-    return random.sample(list(cities), len(cities))
-
-# Function to create neighboring solutions
-def get_neighbors(route):
-    neighbors = []
-    for i in range(len(route)):
-        for j in range(i + 1, len(route)): 
-            neighbor = route.copy()
-            neighbor[i], neighbor[j] = neighbor[j], neighbor[i]
-            neighbors.append(neighbor)
-    return neighbors
-
-#hill climbing function
-def hill_climbing(cities, graph):
+    return random.sample(range(len(cities)), len(cities)) # routes are indices into the distance matrix
+
+CANDIDATES = 8 # neighbours tried for each city
+OR_OPT_MAX = 3 # longest segment an or-opt move relocates
+
+# Function to move the segment s1..s2 (p before s1, q after s2) between the adjacent cities c and e,
+# with x next to c and y next to e, as two or three 2-opt moves
+def move_segment(tour, s1, s2, p, q, x, c, e):
+    if (tour.next(p) == s1) != (tour.next(c) == e): # make e follow c the way s1..s2 runs
+        c, e, x = e, c, s1 if x == s2 else s2
+    if e == p: # the segment goes just behind where it is, same move seen from the other side
+        p, q, s1, s2 = q, p, s2, s1
+        c, e, x = e, c, s1 if x == s2 else s2
+    if x == s1:
+        tour.two_opt_move(p, s1, q, s2) # flip the segment so it goes in the right way round
+        s1, s2 = s2, s1
+    tour.two_opt_move(p, s1, e, c)
+    if c != q:
+        tour.two_opt_move(p, c, s2, q)
+
+# Function to find an improving 2-opt move that adds the edge (a, c) for one of a's candidates
+def find_two_opt(a, tour, d, candidates, first_improvement):
+    best = None
+    best_gain = 0
+    for succ in (tour.next, tour.prev):
+        b = succ(a)
+        d_ab = d(a, b)
+        for c in candidates[a]:
+            g1 = d_ab - d(a, c)
+            if g1 <= 0:
+                break # candidates are sorted, nothing further on can gain
+            e = succ(c)
+            if c == b or e == a:
+                continue
+            gain = g1 + d(c, e) - d(b, e)
+            if gain > best_gain:
+                best_gain, best = gain, ("2opt", a, b, e, c)
+                if first_improvement:
+                    return best_gain, best
+    return best_gain, best
+
+# Function to find an improving or-opt move for a segment of up to OR_OPT_MAX cities starting at a
+def find_or_opt(a, tour, d, candidates, first_improvement):
+    best = None
+    best_gain = 0
+    if len(tour) < 8:
+        return best_gain, best
+    for succ, pred in ((tour.next, tour.prev), (tour.prev, tour.next)):
+        segment = [a]
+        p = pred(a)
+        for length in range(1, OR_OPT_MAX + 1):
+            if length > 1:
+                segment.append(succ(segment[-1]))
+            s2 = segment[-1]
+            q = succ(s2)
+            removed = d(p, a) + d(s2, q) - d(p, q)
+            if removed <= 0:
+                continue
+            for x, y in ((a, s2), (s2, a)):
+                for c in candidates[x]:
+                    d_xc = d(x, c)
+                    if d_xc >= removed:
+                        break
+                    if c in segment:
+                        continue
+                    for e in (tour.next(c), tour.prev(c)):
+                        if e in segment or (c == p and e == q) or (c == q and e == p):
+                            continue
+                        gain = removed - (d_xc + d(y, e) - d(c, e))
+                        if gain > best_gain:
+                            best_gain, best = gain, ("oropt", a, s2, p, q, x, c, e)
+                            if first_improvement:
+                                return best_gain, best
+    return best_gain, best
+
+# Function to apply a move found by find_two_opt or find_or_opt, returns the cities whose
+# don't-look bits have to be cleared
+def apply_move(tour, move):
+    if move[0] == "2opt":
+        tour.two_opt_move(*move[1:])
+        return move[1:]
+    _, s1, s2, p, q, x, c, e = move
+    move_segment(tour, s1, s2, p, q, x, c, e)
+    return (s1, s2, c, e, p, q)
+
+# Function to improve a tour with 2-opt and or-opt moves until no candidate move gains anything.
+# Only edges to a city's nearest candidates are tried and a city is only looked at again
+# (its don't-look bit cleared) when one of its tour edges changes.
+# route can be a list of cities or a Tour.Tour, which is then improved in place.
+# queue lists the cities to look at first, every city when None.
+# cost is the tour's cost when the caller already knows it, saving a pass over the tour.
+# queued is a list of False flags (at least one per city) a caller making many small searches can
+# keep instead of allocating one per call, it is all False again on return.
+# as_list=False returns the Tour itself instead of a list, so a small search on a big tour stays small.
+# token (Anytime.CancelToken) stops the search early, report(route, cost) gets the start and end tours
+def local_search(route, graph, candidates=None, first_improvement=True, or_opt=True, queue=None, cost=None, token=None, report=None,
+                 queued=None, as_list=True):
+    trace = Instrument.active()
+    start = time.perf_counter()
+    tour = route if isinstance(route, Tour.Tour) else Tour.make_tour(route)
+    n = len(tour)
+    if candidates is None:
+        candidates = SpatialIndex.matrix_candidate_lists(graph, CANDIDATES)
+    if not isinstance(candidates, list):
+        candidates = np.asarray(candidates).tolist()
+    d = graph.item # plain int distances
+    if cost is None:
+        cost = tour.cost(graph)
+    if report is not None:
+        report(tour.to_list(), cost)
+    if n < 5:
+        return (tour.to_list() if as_list else tour), cost
+
+    queue = deque(dict.fromkeys(tour.to_list() if queue is None else [int(city) for city in queue]))
+    if queued is None:
+        queued = [False] * n
+    elif len(queued) < n:
+        queued += [False] * (n - len(queued))
+    for city in queue:
+        queued[city] = True
+    examined = two_opt_moves = or_opt_moves = 0
+    while queue and not Anytime.stopped(token):
+        a = queue.popleft()
+        queued[a] = False
+        examined += 1
+        if trace is not None and examined % trace.sample_every == 0:
+            trace.sample("local_search", cost=cost, queue=len(queue))
+        while True:
+            gain, move = find_two_opt(a, tour, d, candidates, first_improvement)
+            if or_opt and (move is None or not first_improvement):
+                or_gain, or_move = find_or_opt(a, tour, d, candidates, first_improvement)
+                if or_gain > gain:
+                    gain, move = or_gain, or_move
+            if move is None:
+                break
+            for city in apply_move(tour, move):
+                if not queued[city]:
+                    queued[city] = True
+                    queue.append(city)
+            cost -= gain
+            if move[0] == "2opt":
+                two_opt_moves += 1
+            else:
+                or_opt_moves += 1
+    for city in queue: # left over when stopped early
+        queued[city] = False
+    if report is not None and two_opt_moves + or_opt_moves:
+        report(tour.to_list(), cost)
+    if trace is not None:
+        trace.add({"cities_examined": examined, "two_opt_moves": two_opt_moves, "or_opt_moves": or_opt_moves}, "local_search.")
+        trace.end_phase("local_search", start)
+    return (tour.to_list() if as_list else tour), cost
+
+#hill climbing function, starts from a random tour unless one is given (e.g. from NearestNeighbour or Christofides)
+def hill_climbing(cities, graph, initial_route=None, candidates=None, first_improvement=True, token=None, report=None):
     begin_time = time.time()
-    current_route = create_initial_route(cities)
-    current_distance = calculate_cost(current_route, graph)
-
-    while True:
-        neighbors = get_neighbors(current_route)
-        next_route = min(neighbors, key= lambda x: calculate_cost(x,graph)) # lamb
-        next_distance = calculate_cost(next_route, graph)
-        
-        if next_distance >= current_distance:
-            break
-        
-        current_route, current_distance = next_route, next_distance
+    current_route = list(initial_route) if initial_route is not None else create_initial_route(cities)
+    if len(current_route) > len(cities): # tours that repeat the start city at the end
+        current_route = current_route[:len(cities)]
+    current_route, current_distance = local_search(current_route, graph, candidates, first_improvement, token=token, report=report)
     end_time = time.time()
     return current_route, current_distance, begin_time, end_time
 
 
-
 # Function to plot the route using matplotlib
 def plot_route(cities, route, problem):
     # Get the coordinates of the cities from the problem
     city_coords = problem.node_coords
 
     # Plot the route
-    route_coords = [city_coords[city] for city in route]
+    route_coords = [city_coords[cities[city]] for city in route]
     route_x = [x for x, y in route_coords]
     route_y = [y for x, y in route_coords]
     
@@ -91,9 +218,11 @@ def plot_route(cities, route, problem):
 if __name__ == "__main__":
     filename = "./tsplib-master/gr202.tsp"  # Replace with your TSP file path
     cities, graph, problem = load_tsp_file(filename)
-    best_route, best_distance, begin_time, end_time = hill_climbing(cities, graph)
-    print("Best Route: ", best_route)
+    candidates = SpatialIndex.candidate_lists(problem, cities, graph, CANDIDATES)
+    best_route, best_distance, begin_time, end_time = hill_climbing(cities, graph, candidates=candidates)
+    print("Best Route: ", [cities[i] for i in best_route])
     print("Total Cost: ", best_distance)
+    print("Parse Time: ", problem.parse_time)
     print("Execution Time: ", ((end_time - begin_time)))
     # Plot the best route
     plot_route(cities, best_route, problem)
\ No newline at end of file